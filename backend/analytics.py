@@ -0,0 +1,218 @@
+"""Capacity planning statistics per feature, vectorized with NumPy
+
+The store records a feature's (total, in_use) only when it changes, packed
+per feature and day (feature_changes). Between two change points the values hold for every
+capture in between, so each change point is a run of identical samples and
+percentiles, time at capacity and demand coverage are computed over runs
+weighted by the time they span rather than over every capture. Only the
+hour-of-week heatmap expands a feature back to one value per capture.
+
+Times are the captures' naive local timestamps read as epoch seconds, so
+hour-of-week buckets follow the wall clock of the collecting machine.
+"""
+import numpy as np
+
+from store import EPOCH
+
+PERCENTILES = (50, 95, 99)
+DEFAULT_COVERAGE = 95.0
+DEFAULT_MAX_GAP_SECONDS = 600  # a capture stands for at most this long when collection stalled
+HOURS_PER_WEEK = 7 * 24
+# 1970-01-01 was a Thursday: shift by three days so hour 0 of the week is Monday 00:00
+EPOCH_WEEK_OFFSET_HOURS = 3 * 24
+
+
+def capture_times(store, start=None, end=None):
+    """Epoch seconds of the captures in [start, end), ascending"""
+    rows = store.execute('SELECT timestamp FROM snapshots WHERE timestamp >= ? AND timestamp < ? '
+                         'ORDER BY timestamp', _bounds(start, end))
+    # NumPy parses the ISO strings far faster than datetime or SQLite's strftime
+    stamps = np.array([row[0] for row in rows], dtype='datetime64[us]')
+    return stamps.astype('datetime64[s]').astype(np.int64)
+
+
+def sample_weights(times, max_gap=DEFAULT_MAX_GAP_SECONDS):
+    """Seconds each capture stands for: the gap to the next one, capped at max_gap
+
+    The last capture gets the median gap.
+    """
+    if len(times) == 0:
+        return np.zeros(0)
+    gaps = np.diff(times).astype(np.float64)
+    last = np.median(gaps) if len(gaps) else 0.0
+    return np.minimum(np.append(gaps, last), max_gap)
+
+
+def feature_changes(store, feature, start=None, end=None):
+    """(epoch seconds, total, in_use) arrays of a feature's change points
+
+    Includes the last change at or before start, which sets the values the
+    window opens with.
+    """
+    first_day = (start - EPOCH).days if start else None
+    last_day = (end - EPOCH).days if end else None
+    rows = store.execute(
+        'SELECT day, data FROM feature_changes WHERE feature = :feature '
+        'AND day <= COALESCE(:last_day, day) AND day >= COALESCE('
+        '(SELECT MAX(day) FROM feature_changes WHERE feature = :feature AND day < :first_day), :first_day, day) '
+        'ORDER BY day',
+        {'feature': feature, 'first_day': first_day, 'last_day': last_day}).fetchall()
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    blocks = [np.frombuffer(row[1], dtype=np.int32).reshape(-1, 3) for row in rows]
+    points = np.concatenate(blocks).astype(np.int64)
+    days = np.repeat(np.array([row[0] for row in rows], dtype=np.int64), [len(b) for b in blocks])
+    times = days * 86400 + points[:, 0]
+
+    keep = np.ones(len(times), dtype=bool)
+    if end is not None:
+        keep &= times < _epoch(end)
+    if start is not None:
+        # Drop everything before the change that is in effect at start
+        opening = np.searchsorted(times, _epoch(start), side='right') - 1
+        keep[:max(opening, 0)] = False
+    return times[keep], points[keep, 1], points[keep, 2]
+
+
+def window_features(store, start=None, end=None):
+    """Features listed by any capture in the window, from the per-day partial aggregates"""
+    lower, upper = _bounds(start, end)
+    rows = store.execute(
+        "SELECT DISTINCT feature FROM partial_features WHERE resolution = 'day' AND bucket >= ? AND bucket < ? "
+        "ORDER BY feature", (lower[:10], upper))
+    return [row[0] for row in rows]
+
+
+def runs(times, weights, change_times, totals, in_use):
+    """Collapse a feature's change points into runs over the captures
+
+    Returns (totals, in_use, samples, seconds) per run, dropping runs that
+    cover no capture or where the feature had no licenses.
+    """
+    first = np.searchsorted(times, change_times, side='left')
+    last = np.append(first[1:], len(times))
+    cumulative = np.concatenate(([0.0], np.cumsum(weights)))
+    samples = last - first
+    seconds = cumulative[last] - cumulative[first]
+    keep = (samples > 0) & (totals > 0)
+    return totals[keep], in_use[keep], samples[keep], seconds[keep]
+
+
+def weighted_percentiles(values, weights, percentiles):
+    """Smallest value whose weighted share at or below it reaches each percentile"""
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    targets = np.asarray(percentiles, dtype=np.float64) / 100 * cumulative[-1]
+    index = np.minimum(np.searchsorted(cumulative, targets, side='left'), len(order) - 1)
+    return values[order][index]
+
+
+def demand_coverage_seats(in_use, weights, coverage):
+    """Fewest seats that would have served coverage% of the seat-time in use
+
+    Seat-time served by s seats is sum(min(in_use, s) * weight); with w_j the
+    weight of runs using more than j seats, that is w_0 + ... + w_(s-1).
+    """
+    demand = float(np.dot(in_use, weights))
+    if demand <= 0:
+        return 0
+    per_count = np.bincount(in_use, weights=weights)
+    above = weights.sum() - np.cumsum(per_count)  # weight of runs with in_use > j
+    served = np.cumsum(above)
+    return int(np.searchsorted(served, demand * coverage / 100 * (1 - 1e-12), side='left')) + 1
+
+
+def feature_capacity(feature, times, weights, changes, coverage=DEFAULT_COVERAGE):
+    """Capacity statistics of one feature, or None when it had no licenses in the window"""
+    totals, in_use, samples, seconds = runs(times, weights, *changes)
+    if samples.sum() == 0:
+        return None
+
+    # Time weights, falling back to capture counts for a single-capture window
+    weight = seconds if seconds.sum() > 0 else samples.astype(np.float64)
+    utilization = in_use / totals * 100
+    at_capacity = in_use >= totals
+    util_p = weighted_percentiles(utilization, weight, PERCENTILES)
+    seats_p = weighted_percentiles(in_use, weight, PERCENTILES)
+
+    stats = {
+        'feature': feature,
+        'total': int(totals[-1]),
+        'max_total': int(totals.max()),
+        'samples': int(samples.sum()),
+        'hours': round(float(seconds.sum()) / 3600, 1),
+        'mean_in_use': round(float(np.dot(in_use, weight) / weight.sum()), 2),
+        'peak_in_use': int(in_use.max()),
+        'mean_utilization': round(float(np.dot(utilization, weight) / weight.sum()), 1),
+        'time_at_capacity_pct': round(float(weight[at_capacity].sum() / weight.sum() * 100), 2),
+        'time_at_capacity_hours': round(float(seconds[at_capacity].sum()) / 3600, 1),
+        'coverage': coverage,
+        'seats_for_time_coverage': int(weighted_percentiles(in_use, weight, [coverage])[0]),
+        'seats_for_demand_coverage': demand_coverage_seats(in_use, weight, coverage)
+    }
+    for p, util, seats in zip(PERCENTILES, util_p, seats_p):
+        stats[f'utilization_p{p}'] = round(float(util), 1)
+        stats[f'in_use_p{p}'] = int(seats)
+    return stats
+
+
+def hour_of_week_heatmap(times, weights, changes):
+    """7 x 24 (Monday first) mean utilization % and peak in_use of one feature"""
+    change_times, totals, in_use = changes
+    index = np.searchsorted(change_times, times, side='right') - 1
+    valid = index >= 0
+    index = index[valid]
+    sample_totals, sample_in_use = totals[index], in_use[index]
+    present = sample_totals > 0
+    hours = ((times[valid][present] // 3600 + EPOCH_WEEK_OFFSET_HOURS) % HOURS_PER_WEEK).astype(np.intp)
+    sample_in_use, sample_totals = sample_in_use[present], sample_totals[present]
+    sample_seconds = weights[valid][present]
+
+    weight = np.bincount(hours, weights=sample_seconds, minlength=HOURS_PER_WEEK)
+    utilization = np.bincount(hours, weights=sample_in_use / sample_totals * 100 * sample_seconds,
+                              minlength=HOURS_PER_WEEK)
+    mean = np.divide(utilization, weight, out=np.zeros(HOURS_PER_WEEK), where=weight > 0)
+    peak = np.zeros(HOURS_PER_WEEK, dtype=np.int64)
+    np.maximum.at(peak, hours, sample_in_use)
+    return {
+        'mean_utilization': np.round(mean, 1).reshape(7, 24).tolist(),
+        'peak_in_use': peak.reshape(7, 24).tolist(),
+        'samples': np.bincount(hours, minlength=HOURS_PER_WEEK).reshape(7, 24).tolist()
+    }
+
+
+def capacity_report(store, start=None, end=None, features=None, coverage=DEFAULT_COVERAGE,
+                    heatmap=False, max_gap=DEFAULT_MAX_GAP_SECONDS):
+    """Capacity statistics for every feature in [start, end), most saturated first
+
+    features limits the report to the given names; heatmap adds the
+    hour-of-week heatmap to each entry, which is only cheap for a few features.
+    """
+    if not 0 < coverage <= 100:
+        raise ValueError('coverage must be a percentage in (0, 100]')
+    times = capture_times(store, start, end)
+    if len(times) == 0:
+        return []
+    weights = sample_weights(times, max_gap)
+
+    report = []
+    for feature in features or window_features(store, start, end):
+        changes = feature_changes(store, feature, start, end)
+        stats = feature_capacity(feature, times, weights, changes, coverage)
+        if stats is None:
+            continue
+        if heatmap:
+            stats['heatmap'] = hour_of_week_heatmap(times, weights, changes)
+        report.append(stats)
+    report.sort(key=lambda s: (s['time_at_capacity_pct'], s['utilization_p95']), reverse=True)
+    return report
+
+
+def _epoch(moment):
+    return int((moment - EPOCH).total_seconds())
+
+
+def _bounds(start, end):
+    return (start.isoformat() if start else '', end.isoformat() if end else '9999')
@@ -1,27 +1,114 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import subprocess
+import cProfile
+import io
 import os
 import json
+import pstats
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-import re
-from threading import Thread
+from threading import Lock, Thread
 import time
 import schedule
 import sys
 
+from analytics import DEFAULT_COVERAGE, capacity_report
+from archive import CaptureArchive
+from cache import LRUCache
+from collector import AsyncCollector
+from diff import diff_licenses, diff_states
+from events import RETRY_MILLISECONDS, EventBroadcaster, parse_event_id
+from export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, export
+from lmstat_parser import parse_license_data
+from logindex import LogIndex
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, SIZE_BUCKETS, Counter, Gauge, Histogram
+from sessions import SessionTracker, checkout_events
+from store import ROLLUP_RESOLUTIONS, SnapshotStore, choose_resolution
+from werkzeug.serving import is_running_from_reloader
+
 app = Flask(__name__)
 CORS(app)
 
 # Configuration
+# 'all' collects and serves in one process (python app.py). serve.py runs one
+# 'collector' process and 'web' processes that only read the shared store.
+# create_app() starts the monitor for the role.
+ROLE = os.environ.get('LICSTATS_ROLE', 'all')
+ROLES = ('all', 'collector', 'web')
 DEBUG_MODE = True  # Set to False to use actual lmstat.exe
-LMSTAT_COMMAND = "lmstat.exe -c 29000@hqcndb -a"
+LMSTAT_SERVERS = ["29000@hqcndb"]  # Polled concurrently; outputs are combined into one capture
+LMSTAT_COMMAND = "lmstat.exe -c {server} -a"
+COLLECT_TIMEOUT = 60  # seconds per lmstat call
+COLLECT_RETRIES = 2  # extra attempts per server after a failure or timeout
+COLLECT_BACKOFF = 2.0  # seconds before the first retry, doubled on each further retry
+COLLECT_MAX_BACKOFF = 30.0
+COLLECT_JITTER = 0.5  # retry delays vary randomly by +/- this fraction
+COLLECT_WAIT_SECONDS = 10  # how long /api/collect waits for the run before answering 202
 LOGS_DIR = "logs"
 DEBUG_FILE = "234.txt"
+STORE_FILE = "licstats.db"  # SQLite store of parsed snapshots
 UPDATE_INTERVAL = 1  # minutes
+MAX_HISTORY_POINTS = 1000  # historical_summary picks a rollup that stays under this
+MINUTE_ROLLUP_RETENTION_DAYS = 7
+RECENT_WINDOW_HOURS = 0  # Hours of latest snapshots held compactly in memory for summaries; off (0) by default
+LOG_FILENAME_FORMAT = "%Y%m%d_%H%M%S.txt"
+ARCHIVE_MODE = False  # Store captures in compressed per-day segments instead of .txt files
+ARCHIVE_DIR = os.path.join(LOGS_DIR, "archive")
+ARCHIVE_RETENTION_DAYS = 365  # Raw captures older than this are deleted; None keeps all
+VIEW_CACHE_SIZE = 64  # Memoized (view, filter, snapshot) results kept in memory
+DEFAULT_PAGE_SIZE = 50  # Items per page of /api/licenses, /api/users and /api/modules
+MAX_PAGE_SIZE = 1000
+DEFAULT_QUERY_TOP = 20  # Groups returned by /api/query
+MAX_QUERY_TOP = 1000
+DEFAULT_SESSIONS_LIMIT = 1000  # Sessions returned by /api/sessions
+MAX_SESSIONS_LIMIT = 10000
+PROFILING_ENABLED = False  # Allow ?profile=1 on any request to return a cProfile summary instead
+PROFILE_TOP = 40  # Functions listed in a profile summary, by cumulative time
+STORE_POLL_SECONDS = 1  # How often web processes look for captures written by the collector
+HEALTH_KEY = 'health_status'  # Store meta keys shared between the collector and web processes
+COLLECT_REQUEST_KEY = 'collect_requested'
+# Open /api/events streams per process, each holding a server thread; further
+# ones get 503. serve.py sets this and adds as many threads to the pool.
+MAX_SSE_CLIENTS = int(os.environ.get('LICSTATS_MAX_SSE_CLIENTS', 32))
+# Fields the paginated views can be sorted by (?sort=field, or -field for descending)
+VIEW_SORT_FIELDS = {
+    'licenses': ('feature', 'total', 'in_use', 'available', 'peak_usage', 'total_duration_minutes'),
+    'users': ('username', 'total_licenses', 'unique_hosts', 'first_seen'),
+    'modules': ('feature', 'total', 'in_use', 'available', 'usage_rate', 'peak_usage', 'total_duration_minutes')
+}
+
+# Instrumentation, rendered at /api/metrics (lmstat timings live in collector.py)
+COLLECTIONS = Counter('licstats_collections_total', 'Collection runs by result (success, partial, error)',
+                      labels=('status',))
+LOG_LISTING_SECONDS = Histogram('licstats_log_listing_duration_seconds',
+                                'Time to list the indexed log files in get_log_files')
+LOG_FILES = Gauge('licstats_log_files', 'Log files found by the last get_log_files listing')
+LOG_INDEX_SECONDS = Histogram('licstats_log_index_reconcile_duration_seconds',
+                              'Time to match the log index to the logs directory')
+PARSE_SECONDS = Histogram('licstats_parse_duration_seconds', 'Time to parse one lmstat output')
+PARSE_LINES = Counter('licstats_parse_lines_total', 'Lines of lmstat output parsed')
+PARSE_BYTES = Counter('licstats_parse_bytes_total', 'Characters of lmstat output parsed')
+PARSE_LINES_PER_SECOND = Gauge('licstats_parse_lines_per_second', 'Parse throughput of the last lmstat output')
+JSON_SECONDS = Histogram('licstats_json_serialize_duration_seconds', 'Time to serialize one JSON response body')
+HTTP_SECONDS = Histogram('licstats_http_request_duration_seconds',
+                         'Time to produce a response (up to the first byte for streams), by route',
+                         labels=('route', 'method', 'status'))
+HTTP_RESPONSE_BYTES = Histogram('licstats_http_response_bytes', 'Response body size by route (streams excluded)',
+                                labels=('route',), buckets=SIZE_BUCKETS)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing each serialization"""
+
+    def dumps(self, obj, **kwargs):
+        with JSON_SECONDS.time():
+            return super().dumps(obj, **kwargs)
+
+app.json = TimedJSONProvider(app)
 
 class LicenseMonitor:
-    def __init__(self):
+    def __init__(self, role='all'):
+        self.role = role
         self.last_update = None
         self.health_status = []
         self.max_health_records = 100
@@ -29,115 +116,245 @@ class LicenseMonitor:
         # Ensure logs directory exists
         if not os.path.exists(LOGS_DIR):
             os.makedirs(LOGS_DIR)
-    
+
+        # Only the collecting process migrates the store and maintains sessions
+        writer = role != 'web'
+        self.store = SnapshotStore(STORE_FILE, migrate=writer)
+        self.archive = CaptureArchive(ARCHIVE_DIR)
+        self.sessions = SessionTracker(self.store, auto_rebuild=writer)
+        self.log_index = LogIndex(self.store, LOGS_DIR)
+        self._load_health(self.store.get_meta(HEALTH_KEY))
+
+        # Most recent parsed snapshot, replaced as a whole after each collection
+        # so readers never see a half-updated one. Treat it as read-only.
+        self._latest = None
+        self._latest_lock = Lock()
+        self.view_cache = LRUCache(VIEW_CACHE_SIZE)
+
+        self.collector = AsyncCollector(
+            LMSTAT_SERVERS, LMSTAT_COMMAND,
+            timeout=COLLECT_TIMEOUT, retries=COLLECT_RETRIES,
+            backoff=COLLECT_BACKOFF, max_backoff=COLLECT_MAX_BACKOFF, jitter=COLLECT_JITTER,
+            debug_file=resource_path(DEBUG_FILE) if DEBUG_MODE else None)
+        # Pushes collection diffs and health records to /api/events subscribers
+        self.events = EventBroadcaster(max_clients=MAX_SSE_CLIENTS)
+
+        # Cross-process collection requests: the last one the collector started,
+        # and in web processes the (request time, Future) awaiting its result
+        self._collect_handled = self.store.get_meta(COLLECT_REQUEST_KEY)
+        self._collect_pending = None
+        self._collect_lock = Lock()
+        self._store_version = None  # highest snapshot id a web process has seen
+
+    def trigger_collection(self):
+        """Start collecting from every server, or join the run already in flight
+
+        Returns a concurrent.futures.Future resolving to True/False. Web
+        processes ask the collector process through the store instead.
+        """
+        if self.role == 'web':
+            return self._request_collection()
+        return self.collector.run(self._store_capture)
+
     def execute_lmstat(self):
-        """Execute lmstat command or read debug file"""
+        """Collect lmstat output (or the debug file) and wait for it to be stored"""
+        return self.trigger_collection().result()
+
+    def _store_capture(self, results, timestamp=None):
+        """Persist and parse one run's (server, output or exception) results
+
+        timestamp is the capture time, now unless a replay supplies it.
+        """
         try:
-            if DEBUG_MODE:
-                # Read from debug file
-                with open(resource_path(DEBUG_FILE), 'r', encoding='utf-8') as f:
-                    output = f.read()
-            else:
-                # Execute actual command
-                result = subprocess.run(LMSTAT_COMMAND, shell=True, 
-                                      capture_output=True, text=True, 
-                                      timeout=60)
-                if result.returncode != 0:
-                    raise Exception(f"Command failed: {result.stderr}")
-                output = result.stdout
-            
+            outputs = [output for _, output in results if not isinstance(output, BaseException)]
+            errors = [str(output) for _, output in results if isinstance(output, BaseException)]
+            if not outputs:
+                raise Exception('; '.join(errors) or 'No license servers configured')
+            output = '\n'.join(outputs)
+
             # Save to log file with timestamp
-            timestamp = datetime.now()
-            filename = timestamp.strftime("%Y%m%d_%H%M%S.txt")
-            filepath = os.path.join(LOGS_DIR, filename)
+            timestamp = timestamp or datetime.now()
+            filename = timestamp.strftime(LOG_FILENAME_FORMAT)
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(output)
+            if ARCHIVE_MODE:
+                self.archive.append(filename, output)
+            else:
+                # Write via a temp file so sync_store never sees a partial capture
+                filepath = os.path.join(LOGS_DIR, filename)
+                tmp_path = filepath + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(output)
+                os.replace(tmp_path, filepath)
+
+            # Parse once at collection time; all aggregation reads the store
+            licenses = self.parse_license_data(output)
+            snapshot_id = self.store.add_snapshot(timestamp, filename, licenses)
+            if not ARCHIVE_MODE:
+                self.log_index.add(filename, snapshot_id)
+            self.store.prune_rollups('minute', timestamp - timedelta(days=MINUTE_ROLLUP_RETENTION_DAYS))
+
+            if snapshot_id is None:
+                # Same-second capture already stored; keep whatever the store has
+                self._refresh_latest()
+            else:
+                previous = self._latest
+                session_events = self.sessions.observe(timestamp, licenses)
+                snapshot = {
+                    'id': snapshot_id,
+                    'filename': filename,
+                    'timestamp': timestamp.isoformat(),
+                    'licenses': licenses
+                }
+                self._set_latest(snapshot)
+                self._publish_update(previous, snapshot, session_events)
             
             self.last_update = timestamp
-            self.health_status.append({
+            health = {
                 'timestamp': timestamp.isoformat(),
                 'status': 'success'
-            })
+            }
+            if errors:
+                # Partial capture: some servers are missing from it
+                health['errors'] = errors
+            self._record_health(health)
             
-            # Keep only last 100 health records
-            if len(self.health_status) > self.max_health_records:
-                self.health_status = self.health_status[-self.max_health_records:]
-            
-            print(f"License data collected at {timestamp}")
+            print(f"License data collected at {timestamp} "
+                  f"({len(outputs)}/{len(results)} servers)")
+            for error in errors:
+                print(f"Error collecting license data: {error}")
+            COLLECTIONS.inc(status='partial' if errors else 'success')
             return True
             
         except Exception as e:
-            self.health_status.append({
+            COLLECTIONS.inc(status='error')
+            health = {
                 'timestamp': datetime.now().isoformat(),
                 'status': 'error',
                 'error': str(e)
-            })
+            }
             print(f"Error collecting license data: {e}")
+            self._record_health(health)
             return False
+
+    def _record_health(self, health):
+        """Keep the last health records, share them with web processes and push the new one"""
+        self.health_status = (self.health_status + [health])[-self.max_health_records:]
+        try:
+            self.store.set_meta(HEALTH_KEY, json.dumps(self.health_status))
+        except Exception as e:
+            print(f"Error saving health status: {e}")
+        self.events.publish('status', {
+            'last_update': self.last_update.isoformat() if self.last_update else None,
+            'health': health
+        })
+
+    def _load_health(self, records_json):
+        """Adopt health records saved by the collecting process; returns the ones not seen yet"""
+        records = json.loads(records_json) if records_json else []
+        known = self.health_status[-1]['timestamp'] if self.health_status else ''
+        successes = [r for r in records if r['status'] == 'success']
+        self.last_update = datetime.fromisoformat(successes[-1]['timestamp']) if successes else None
+        self.health_status = records
+        return [r for r in records if r['timestamp'] > known]
+
+    def check_collect_request(self):
+        """Collector: start a run when a web process asked for one through the store"""
+        requested = self.store.get_meta(COLLECT_REQUEST_KEY)
+        if requested != self._collect_handled:
+            self._collect_handled = requested
+            self.trigger_collection()
+
+    def _request_collection(self):
+        """Web: ask the collector process for a run, or join the request already waiting
+
+        The Future resolves when a health record at or after the request
+        appears (see follow_store).
+        """
+        with self._collect_lock:
+            if self._collect_pending is None:
+                requested = datetime.now().isoformat()
+                self.store.set_meta(COLLECT_REQUEST_KEY, requested)
+                self._collect_pending = (requested, Future())
+            return self._collect_pending[1]
+
+    def follow_store(self):
+        """Web: pick up the captures and health records the collector process writes"""
+        self.keep_recent_snapshots()
+        health_json = None
+        while True:
+            try:
+                self._follow_snapshots()
+                latest_health = self.store.get_meta(HEALTH_KEY)
+                if latest_health != health_json:
+                    health_json = latest_health
+                    self._follow_health(latest_health)
+            except Exception as e:
+                print(f"Error following the snapshot store: {e}")
+            time.sleep(STORE_POLL_SECONDS)
+
+    def _follow_snapshots(self):
+        # Snapshot ids only grow, so a new maximum means new captures
+        newest = self.store.execute('SELECT MAX(id) FROM snapshots').fetchone()[0]
+        if newest is None or newest == self._store_version:
+            return
+        first_poll = self._store_version is None
+        self._store_version = newest
+        self.log_index.refresh()
+        previous = self._latest
+        snapshot = self._refresh_latest()
+        if first_poll:
+            return
+        if previous is not None and snapshot['id'] == previous['id']:
+            # Backfilled history changes the window views of the same snapshot
+            self.view_cache.clear()
+            self.events.publish('reset', {'timestamp': snapshot['timestamp']})
+            return
+        session_events = []
+        if previous is not None:
+            session_events = checkout_events(previous['licenses'], snapshot['licenses'],
+                                             datetime.fromisoformat(snapshot['timestamp']))
+        self._publish_update(previous, snapshot, session_events)
+
+    def _follow_health(self, records_json):
+        for health in self._load_health(records_json):
+            self.events.publish('status', {
+                'last_update': self.last_update.isoformat() if self.last_update else None,
+                'health': health
+            })
+        with self._collect_lock:
+            pending = self._collect_pending
+            if pending is None:
+                return
+            finished = [r for r in self.health_status if r['timestamp'] >= pending[0]]
+            if finished:
+                self._collect_pending = None
+                pending[1].set_result(finished[-1]['status'] == 'success')
+
+    def _publish_update(self, previous, snapshot, session_events):
+        """Broadcast what changed since the previous snapshot to /api/events subscribers"""
+        if previous is None or previous['timestamp'] > snapshot['timestamp']:
+            self.events.publish('reset', {'timestamp': snapshot['timestamp']})
+            return
+        self.events.publish('update', {
+            'timestamp': snapshot['timestamp'],
+            'snapshot_id': snapshot['id'],
+            'features': diff_licenses(previous['licenses'], snapshot['licenses'])['features'],
+            'checked_out': [event_user(e) for e in session_events if e['event'] == 'open'],
+            'checked_in': [event_user(e) for e in session_events if e['event'] == 'close'],
+            'summary': license_summary(snapshot['licenses'])
+        })
     
     def parse_license_data(self, content):
         """Parse license usage data from lmstat output"""
-        licenses = []
-        lines = content.split('\n')
-        
-        current_feature = None
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Match feature usage lines
-            feature_match = re.match(r'Users of ([^:]+):\s+\(Total of (\d+) licenses issued;\s+Total of (\d+) licenses? in use\)', line)
-            if feature_match:
-                feature_name = feature_match.group(1)
-                total_licenses = int(feature_match.group(2))
-                licenses_in_use = int(feature_match.group(3))
-                
-                current_feature = {
-                    'feature': feature_name,
-                    'total': total_licenses,
-                    'in_use': licenses_in_use,
-                    'available': total_licenses - licenses_in_use,
-                    'users': []
-                }
-                licenses.append(current_feature)
-                
-                # If there are licenses in use, look for user details in following lines
-                if licenses_in_use > 0:
-                    j = i + 1
-                    # Skip the feature description lines (like "solid_modeling" v2024.12, vendor: ugslmd)
-                    while j < len(lines) and not lines[j].strip().startswith('Users of'):
-                        detail_line = lines[j].strip()
-                        
-                        # Look for user detail lines (they typically start with a username)
-                        # Pattern: username hostname details (HQCNDB/29000 port), start date time (linger: number)
-                        user_match = re.match(r'^(\w+)\s+([^\s]+)\s+.*?\(([^)]+)\),\s*start\s+(.+?)\s*\(linger:\s*(\d+)\)', detail_line)
-                        if user_match:
-                            username = user_match.group(1)
-                            hostname = user_match.group(2)
-                            connection_info = user_match.group(3)
-                            start_time = user_match.group(4)
-                            linger_time = user_match.group(5)
-                            
-                            user_info = {
-                                'user': username,
-                                'host': hostname,
-                                'connection': connection_info,
-                                'start_time': start_time,
-                                'linger': linger_time,
-                                'details': detail_line
-                            }
-                            current_feature['users'].append(user_info)
-                        
-                        j += 1
-                        # Break if we hit the next "Users of" line
-                        if j < len(lines) and lines[j].strip().startswith('Users of'):
-                            break
-                    
-                    i = j - 1  # Adjust index to continue from the right position
-            
-            i += 1
-        
+        started = time.perf_counter()
+        licenses = parse_license_data(content)
+        elapsed = time.perf_counter() - started
+        lines = content.count('\n') + 1
+        PARSE_SECONDS.observe(elapsed)
+        PARSE_LINES.inc(lines)
+        PARSE_BYTES.inc(len(content))
+        if elapsed > 0:
+            PARSE_LINES_PER_SECOND.set(round(lines / elapsed))
         return licenses
     
     def get_user_statistics(self, licenses):
@@ -196,170 +413,498 @@ class LicenseMonitor:
         module_stats.sort(key=lambda x: x['peak_usage'], reverse=True)
         return module_stats
 
-    def get_historical_summary(self, time_filter='week'):
-        """Get historical summary of license usage."""
-        log_files = self.get_log_files(time_filter)
-        
-        # We want chronological order, so reverse the list
-        log_files.reverse()
-        
-        summary_data = []
-        
-        for log_file in log_files:
+    def get_historical_summary(self, time_filter='week', resolution='auto', feature=None):
+        """Get historical summary of license usage.
+
+        resolution is 'raw' (one point per snapshot, totals only, so not with
+        a feature), 'minute', 'hour', 'day' or 'auto', which picks the finest
+        rollup with at most MAX_HISTORY_POINTS buckets in the window.
+        """
+        start, end = filter_window(time_filter)
+        if resolution == 'raw':
+            if feature is not None:
+                raise ValueError('resolution=raw does not support feature')
+            return self.store.historical_summary(start, end)
+
+        if resolution == 'auto':
+            window_from = start or self.store.first_timestamp()
+            if window_from is None:
+                return []
+            resolution = choose_resolution(window_from, end or datetime.now(), MAX_HISTORY_POINTS)
+        return self.store.rollup_summary(resolution, start, feature, end)
+
+    def keep_recent_snapshots(self):
+        """Load the in-memory window of recent snapshots (see compact.py)"""
+        if not RECENT_WINDOW_HOURS:
+            return
+        try:
+            self.store.keep_recent(RECENT_WINDOW_HOURS)
+        except Exception as e:
+            print(f"Error loading recent snapshots: {e}")
+
+    def sync_store(self):
+        """Update the log index from the logs directory and ingest captures not yet in the store"""
+        self.reconcile_log_index()
+        known = self.store.known_filenames()
+        pending = [f for f in self.log_index.filenames() if f not in known]
+        pending.sort()
+
+        ingested = 0
+        out_of_order = False
+        for filename in pending:
+            filepath = os.path.join(LOGS_DIR, filename)
             try:
-                with open(log_file['filepath'], 'r', encoding='utf-8') as f:
+                with open(filepath, 'r', encoding='utf-8') as f:
                     content = f.read()
-                
-                licenses = self.parse_license_data(content)
-                
-                total_licenses_in_use = sum(l['in_use'] for l in licenses)
-                
-                # To get unique users, we need to aggregate them first
-                user_stats = self.get_user_statistics(licenses)
-                total_users = len(user_stats)
-                
-                summary_data.append({
-                    'timestamp': log_file['timestamp'],
-                    'total_licenses_in_use': total_licenses_in_use,
-                    'total_users': total_users
-                })
+                out_of_order |= self._ingest(capture_time(filepath), filename, content)
+                ingested += 1
+            except Exception as e:
+                print(f"Error ingesting log file {filename}: {e}")
+                continue
+
+        for entry in reversed(self.archive.list_captures()):
+            if entry['filename'] in known:
+                continue
+            try:
+                content = self.archive.read(entry['filename'])
+                out_of_order |= self._ingest(datetime.fromisoformat(entry['timestamp']),
+                                             entry['filename'], content)
+                ingested += 1
             except Exception as e:
-                print(f"Error processing log file {log_file['filename']}: {e}")
-                # Optionally skip corrupted files
+                print(f"Error ingesting archived capture {entry['filename']}: {e}")
                 continue
-                
-        return summary_data
+
+        if out_of_order:
+            # History older than the newest tracked snapshot was added
+            self.sessions.rebuild()
+
+        if ingested:
+            print(f"Ingested {ingested} log files into the snapshot store")
+            # Backfilled history changes the window views of the current snapshot
+            self.view_cache.clear()
+            latest = self._refresh_latest()
+            # Clients cannot patch their views with backfilled history; they reload
+            self.events.publish('reset', {'timestamp': latest['timestamp'] if latest else None})
+        return ingested
+
+    def _ingest(self, timestamp, filename, content):
+        """Store one backfilled capture; returns True if it predates the session watermark"""
+        licenses = self.parse_license_data(content)
+        snapshot_id = self.store.add_snapshot(timestamp, filename, licenses)
+        if snapshot_id is None:
+            return False
+        self.log_index.set_snapshot(filename, snapshot_id)
+        watermark = self.sessions.watermark
+        if watermark is not None and timestamp <= watermark:
+            return True
+        self.sessions.observe(timestamp, licenses)
+        return False
+
+    def maintain_archive(self):
+        """Nightly archive job: migrate leftover .txt logs, compact yesterday, apply retention"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            if ARCHIVE_MODE:
+                migrated = self.archive.migrate(LOGS_DIR, before=today)
+                if migrated:
+                    print(f"Archived {migrated} plain log files")
+            self.archive.compact((today - timedelta(days=1)).strftime('%Y%m%d'))
+            if ARCHIVE_RETENTION_DAYS:
+                pruned = self.archive.prune(today - timedelta(days=ARCHIVE_RETENTION_DAYS))
+                if pruned:
+                    print(f"Pruned {pruned} archived captures past retention")
+        except Exception as e:
+            print(f"Error maintaining capture archive: {e}")
+        # Archived or deleted .txt files leave the index
+        self.reconcile_log_index()
+
+    def reconcile_log_index(self):
+        try:
+            with LOG_INDEX_SECONDS.time():
+                added, removed = self.log_index.reconcile()
+            if added or removed:
+                print(f"Log index: {added} files added, {removed} removed")
+        except Exception as e:
+            print(f"Error indexing log files: {e}")
     
     def get_log_files(self, time_filter='latest'):
-        """Get log files based on time filter"""
-        all_files = []
-        for filename in os.listdir(LOGS_DIR):
-            if filename.endswith('.txt'):
-                filepath = os.path.join(LOGS_DIR, filename)
-                try:
-                    mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-                    all_files.append({
-                        'filename': filename,
-                        'filepath': filepath,
-                        'timestamp': mtime.isoformat(),
-                        'size': os.path.getsize(filepath)
-                    })
-                except FileNotFoundError:
-                    # File might be deleted between listdir and getmtime
-                    continue
-        
-        # Sort by timestamp descending to find the latest files first
-        all_files.sort(key=lambda x: x['timestamp'], reverse=True)
-
+        """Get log files for a filter or a (start, end) window, newest first"""
+        LOG_FILES.set(len(self.log_index))
         if time_filter == 'latest':
-            return all_files[:1]
+            with LOG_LISTING_SECONDS.time():
+                latest = self.log_index.latest()
+            archived = self.archive.latest_capture()
+            if archived and (latest is None or archived['timestamp'] > latest['timestamp']):
+                latest = archived
+            return [latest] if latest else []
 
-        now = datetime.now()
-        if time_filter == 'week':
-            week_ago = now - timedelta(days=7)
-            return [f for f in all_files if datetime.fromisoformat(f['timestamp']) >= week_ago]
-        
-        if time_filter == 'month':
-            month_ago = now - timedelta(days=30)
-            return [f for f in all_files if datetime.fromisoformat(f['timestamp']) >= month_ago]
-        
-        # Fallback for unknown filter, return all
-        return all_files
+        # Unknown filters have no start and return all files
+        start, end = filter_window(time_filter)
+        with LOG_LISTING_SECONDS.time():
+            files = self.log_index.between(start, end)
+        files.reverse()
+
+        # Archived captures are listed from the segment indexes of the window's days only
+        archived = self.archive.list_captures(start, end)
+        if archived:
+            files.extend(archived)
+            files.sort(key=lambda x: x['timestamp'], reverse=True)
+        return files
     
-    def get_latest_license_data(self):
-        """Get parsed license data from latest log file"""
-        files = self.get_log_files('latest')
-        if not files:
+    def read_log_content(self, filename):
+        """Read a raw capture from the logs directory or the archive, or None if it is gone"""
+        filepath = os.path.join(LOGS_DIR, filename)
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return self.archive.read(filename)
+
+    def get_capture_licenses(self, filename, content):
+        """Licenses of a capture: its stored snapshot when it was ingested, else parsed from content"""
+        snapshot_id = self.log_index.snapshot_id(filename)
+        if snapshot_id is None:
+            row = self.store.find_snapshot(filename)
+            if row is None:
+                return self.parse_license_data(content)
+            snapshot_id = row['id']
+        return self.store.load_licenses(snapshot_id)
+
+    def get_diff(self, start, end):
+        """Structured diff between the snapshots at two points
+
+        start/end are capture filenames or datetimes (the newest snapshot at or
+        before each is used); end defaults to the latest snapshot. Returns
+        None when either point has no snapshot.
+        """
+        before = self.store.find_snapshot(start)
+        after = self.store.find_snapshot(end) if end is not None else self.store.latest_snapshot()
+        if before is None or after is None:
             return None
-        
-        latest_file = files[0]
-        with open(latest_file['filepath'], 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        licenses = self.parse_license_data(content)
-        return {
-            'timestamp': latest_file['timestamp'],
-            'licenses': licenses,
-            'raw_content': content
+        diff = diff_states(self.store.load_state(before['id']), self.store.load_state(after['id']))
+        diff['from'] = {'filename': before['filename'], 'timestamp': before['timestamp']}
+        diff['to'] = {'filename': after['filename'], 'timestamp': after['timestamp']}
+        return diff
+
+    def iter_raw_captures(self, files):
+        """Yield one NDJSON line per capture, holding a single capture in memory at a time"""
+        for entry in files:
+            content = self.read_log_content(entry['filename'])
+            if content is None:
+                # Pruned or migrated since it was listed
+                continue
+            yield json.dumps({
+                'filename': entry['filename'],
+                'timestamp': entry['timestamp'],
+                'content': content
+            }, ensure_ascii=False) + '\n'
+
+    def _set_latest(self, snapshot):
+        with self._latest_lock:
+            current = self._latest
+            if current is None or snapshot['timestamp'] >= current['timestamp']:
+                self._latest = snapshot
+
+    def _refresh_latest(self):
+        """Reload the in-memory latest snapshot from the store"""
+        row = self.store.latest_snapshot()
+        if row is None:
+            return None
+        snapshot = {
+            'id': row['id'],
+            'filename': row['filename'],
+            'timestamp': row['timestamp'],
+            'licenses': self.store.load_licenses(row['id'])
         }
+        with self._latest_lock:
+            self._latest = snapshot
+        return snapshot
+
+    def _cached_view(self, name, time_filter, compute):
+        """Memoize a derived view per (name, filter, latest snapshot id)"""
+        latest = self._latest or self._refresh_latest()
+        key = (name, time_filter, latest['id'] if latest else None)
+        return self.view_cache.get_or_compute(key, compute)
+
+    def get_latest_license_data(self):
+        """Get the latest parsed snapshot from memory (loaded from the store once)
+
+        The returned dict is shared between requests and must not be modified.
+        """
+        latest = self._latest or self._refresh_latest()
+        if latest is None:
+            return None
+        return latest
 
     def get_aggregated_license_data(self, time_filter='latest'):
-        """Get aggregated license data from log files based on time filter"""
+        """Get aggregated license data based on time filter, memoized per snapshot"""
+        return self._cached_view('licenses', time_filter,
+                                 lambda: self._aggregate_license_data(time_filter))
+
+    def _aggregate_license_data(self, time_filter):
         if time_filter == 'latest':
             data = self.get_latest_license_data()
-            if data and data.get('licenses'):
-                for lic in data['licenses']:
-                    lic['peak_usage'] = lic['in_use']
-                    lic['total_duration_minutes'] = UPDATE_INTERVAL if lic['in_use'] > 0 else 0
-            return data
-
-        log_files = self.get_log_files(time_filter)
-        if not log_files:
-            return None
+            if not data:
+                return data
+            licenses = [dict(lic,
+                             peak_usage=lic['in_use'],
+                             total_duration_minutes=UPDATE_INTERVAL if lic['in_use'] > 0 else 0)
+                        for lic in data['licenses']]
+            return {
+                'timestamp': data['timestamp'],
+                'licenses': licenses,
+                'summary': license_summary(licenses)
+            }
 
-        aggregated_licenses = {}
-        all_raw_content = []
-        latest_timestamp = log_files[0]['timestamp'] if log_files else "N/A"
-
-        for log_file in log_files:
-            try:
-                with open(log_file['filepath'], 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    all_raw_content.append(f"--- Log from {log_file['filename']} ---\n{content}")
-                
-                licenses = self.parse_license_data(content)
-                
-                for license_data in licenses:
-                    feature = license_data['feature']
-                    if feature not in aggregated_licenses:
-                        aggregated_licenses[feature] = {
-                            'feature': feature,
-                            'total': 0,
-                            'peak_usage': 0,
-                            'total_duration_minutes': 0,
-                            'users': {}
-                        }
-                    
-                    agg_license = aggregated_licenses[feature]
-                    agg_license['total'] = max(agg_license['total'], license_data['total'])
-                    agg_license['peak_usage'] = max(agg_license['peak_usage'], license_data['in_use'])
-                    
-                    # Add duration for each user found in this log file
-                    if license_data['in_use'] > 0:
-                        agg_license['total_duration_minutes'] += UPDATE_INTERVAL * license_data['in_use']
+        start, end = filter_window(time_filter)
+        aggregated = self.store.aggregate_licenses(start, end)
+        if not aggregated:
+            return None
 
-                    for user in license_data['users']:
-                        user_key = f"{user['user']}|{user['host']}"
-                        if user_key not in agg_license['users']:
-                             agg_license['users'][user_key] = user
-
-            except Exception as e:
-                print(f"Error processing log file for aggregation {log_file['filename']}: {e}")
-                continue
-        
-        # Get latest 'in_use' count from the most recent file
-        latest_data = self.get_latest_license_data()
-        latest_licenses = {lic['feature']: lic for lic in latest_data.get('licenses', [])}
+        # Current 'in_use' comes from the last snapshot in the window: the
+        # most recent one, unless the window ends in the past
+        if end is None:
+            last_data = self.get_latest_license_data()
+        else:
+            row = self.store.last_snapshot(start, end)
+            if row is None:
+                return None
+            last_data = {'timestamp': row['timestamp'], 'licenses': self.store.load_licenses(row['id'])}
+        last_licenses = {lic['feature']: lic for lic in last_data.get('licenses', [])}
 
         final_licenses = []
-        for feature, data in aggregated_licenses.items():
-            data['users'] = list(data['users'].values())
-            
-            # Set current 'in_use' from the latest data
-            if feature in latest_licenses:
-                data['in_use'] = latest_licenses[feature]['in_use']
-            else:
-                data['in_use'] = 0
-            
-            data['available'] = data['total'] - data['in_use']
-            final_licenses.append(data)
+        for feature, agg in aggregated.items():
+            in_use = last_licenses[feature]['in_use'] if feature in last_licenses else 0
+            final_licenses.append({
+                'feature': feature,
+                'total': agg['total'],
+                'peak_usage': agg['peak_usage'],
+                'total_duration_minutes': UPDATE_INTERVAL * agg['in_use_sum'],
+                'users': agg['users'],
+                'in_use': in_use,
+                'available': agg['total'] - in_use
+            })
 
+        # Raw captures are not part of aggregate responses, see /api/raw_logs
         return {
-            'timestamp': latest_timestamp,
+            'timestamp': last_data['timestamp'],
             'licenses': final_licenses,
-            'raw_content': "\n".join(all_raw_content)
+            'summary': license_summary(final_licenses)
         }
 
+    def get_user_view(self, time_filter='latest'):
+        """User statistics response for a filter, memoized per snapshot"""
+        def compute():
+            if time_filter == 'latest':
+                data = self.get_latest_license_data()
+            else:
+                data = self.get_aggregated_license_data(time_filter)
+            if not data or not data.get('licenses'):
+                return None
+            user_stats = self.get_user_statistics(data['licenses'])
+            return {
+                'timestamp': data['timestamp'],
+                'users': user_stats,
+                'total_users': len(user_stats)
+            }
+        return self._cached_view('users', time_filter, compute)
+
+    def get_module_view(self, time_filter='latest'):
+        """Module statistics response for a filter, memoized per snapshot"""
+        def compute():
+            data = self.get_aggregated_license_data(time_filter)
+            if not data or not data.get('licenses'):
+                return None
+            module_stats = self.get_module_statistics(data['licenses'])
+            return {
+                'timestamp': data['timestamp'],
+                'modules': module_stats,
+                'total_active_modules': len(module_stats)
+            }
+        return self._cached_view('modules', time_filter, compute)
+
+    def get_realtime_stats(self):
+        """Latest user and license counts, memoized per snapshot"""
+        def compute():
+            data = self.get_latest_license_data()
+            if not data or not data.get('licenses'):
+                return None
+            licenses = data['licenses']
+            user_set = set()
+            for license_data in licenses:
+                for user in license_data.get('users', []):
+                    user_set.add(user['user'])
+            return {
+                'timestamp': data['timestamp'],
+                'total_licenses_in_use': sum(l.get('in_use', 0) for l in licenses),
+                'total_users': len(user_set)
+            }
+        return self._cached_view('realtime', 'latest', compute)
+
+    def get_capacity_report(self, window, start, end, features=None, coverage=DEFAULT_COVERAGE, heatmap=False):
+        """Capacity planning statistics per feature (see analytics.py), memoized per snapshot
+
+        window identifies the requested window (filter or from/to) in the cache key.
+        """
+        key = ('capacity', tuple(features or ()), coverage, heatmap)
+        return self._cached_view(key, window, lambda: capacity_report(
+            self.store, start, end, features=features, coverage=coverage, heatmap=heatmap))
+
+    def query_view(self, view, time_filter, search='', sort=''):
+        """Items of the licenses/users/modules view, searched and sorted, memoized per snapshot
+
+        Returns (view data, items) or (None, None) when the view has no data.
+        """
+        if view == 'licenses':
+            data = self.get_aggregated_license_data(time_filter)
+        elif view == 'users':
+            data = self.get_user_view(time_filter)
+        else:
+            data = self.get_module_view(time_filter)
+        if not data or (view == 'licenses' and not data['licenses']):
+            return None, None
+
+        def compute():
+            items = data[view]
+            if search:
+                items = [item for item in items if matches_search(view, item, search)]
+            if sort:
+                field = sort.lstrip('-')
+                items = sorted(items, key=lambda item: sort_value(item.get(field)),
+                               reverse=sort.startswith('-'))
+            return items
+
+        if not search and not sort:
+            return data, data[view]
+        return data, self._cached_view((view, search, sort), time_filter, compute)
+
+def request_filter(default_filter='latest'):
+    """Filter of a request: its (start, end) window when from/to are given, else the filter name
+
+    Raises ValueError for malformed from/to.
+    """
+    if request.args.get('from') or request.args.get('to'):
+        return request_window()
+    return request.args.get('filter', default_filter)
+
+def request_window(default_filter='month'):
+    """Time window of a request: explicit from/to ISO timestamps, else the filter"""
+    start = request.args.get('from')
+    end = request.args.get('to')
+    if start or end:
+        return (datetime.fromisoformat(start) if start else None,
+                datetime.fromisoformat(end) if end else None)
+    return window_start(request.args.get('filter', default_filter)), None
+
+def page_request(view):
+    """Parse ?page=&page_size=&sort=&search= for a paginated view; raises ValueError"""
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('page and page_size must be integers')
+    if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f'page must be >= 1 and page_size between 1 and {MAX_PAGE_SIZE}')
+
+    sort = request.args.get('sort', '').strip()
+    if sort and sort.lstrip('-') not in VIEW_SORT_FIELDS[view]:
+        raise ValueError(f"Cannot sort {view} by {sort.lstrip('-')}; "
+                         f"use one of {', '.join(VIEW_SORT_FIELDS[view])}")
+    return {
+        'page': page,
+        'page_size': page_size,
+        'sort': sort,
+        'search': request.args.get('search', '').strip().lower()
+    }
+
+def paginated_view(view):
+    """Respond with one page of the licenses/users/modules view for the request's filter"""
+    try:
+        page = page_request(view)
+        time_filter = request_filter()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    data, items = monitor.query_view(view, time_filter, page['search'], page['sort'])
+    if data is None:
+        return jsonify({'error': 'No data available for the selected period'}), 404
+    return jsonify(paginate(view, data, items, page))
+
+def paginate(view, data, items, page):
+    """Response for one page of a view: its items plus the view's scalar fields"""
+    response = {key: value for key, value in data.items() if key != view}
+    offset = (page['page'] - 1) * page['page_size']
+    response.update({
+        view: items[offset:offset + page['page_size']],
+        'page': page['page'],
+        'page_size': page['page_size'],
+        'total_items': len(items),
+        'total_pages': -(-len(items) // page['page_size']),
+        'sort': page['sort'],
+        'search': page['search']
+    })
+    return response
+
+def matches_search(view, item, term):
+    """Case-insensitive substring match over the fields the dashboard search box covers"""
+    if view == 'users':
+        fields = [item['username']] + item['hosts'] + [lic['feature'] for lic in item['licenses']]
+    else:
+        fields = [item['feature']]
+        for user in item.get('users', []):
+            fields.append(user.get('user') or user.get('username') or '')
+            fields.append(user.get('host', ''))
+    return any(term in field.lower() for field in fields)
+
+def sort_value(value):
+    if isinstance(value, str):
+        return value.lower()
+    return value if value is not None else 0
+
+def license_summary(licenses):
+    """Dashboard totals over a whole license view, independent of the page shown"""
+    users = set()
+    for license_data in licenses:
+        for user in license_data.get('users', []):
+            users.add(user['user'])
+    return {
+        'total_features': len(licenses),
+        'total_in_use': sum(lic.get('in_use', 0) for lic in licenses),
+        'total_users': len(users)
+    }
+
+def event_user(event):
+    """Compact form of a session open/close event for push messages"""
+    return {
+        'feature': event['feature'],
+        'user': event['user'],
+        'host': event['host'],
+        'start_time': event['start_time']
+    }
+
+def filter_window(time_filter):
+    """(start, end) of a filter name or of an explicit (start, end) window"""
+    if isinstance(time_filter, tuple):
+        return time_filter
+    return window_start(time_filter), None
+
+def window_start(time_filter):
+    """Return the start of the time window for a filter, or None for all history"""
+    now = datetime.now()
+    if time_filter == 'week':
+        return now - timedelta(days=7)
+    if time_filter == 'month':
+        return now - timedelta(days=30)
+    if time_filter == 'year':
+        return now - timedelta(days=365)
+    return None
+
+def capture_time(filepath):
+    """Capture time of a log file, taken from its name with mtime as fallback"""
+    try:
+        return datetime.strptime(os.path.basename(filepath), LOG_FILENAME_FORMAT)
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(filepath))
+
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     try:
@@ -371,29 +916,93 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-# Initialize monitor
-monitor = LicenseMonitor()
+# Created by create_app()
+monitor = None
+scheduler_thread = None
 
 # Scheduled task
 def scheduled_task():
     monitor.execute_lmstat()
 
+def maintenance_task():
+    monitor.maintain_archive()
+
 # Schedule the task
 schedule.every(UPDATE_INTERVAL).minutes.do(scheduled_task)
+schedule.every().day.at("03:00").do(maintenance_task)
 
 def run_scheduler():
+    monitor.keep_recent_snapshots()
+    # Bring the store up to date with captures collected before it existed
+    monitor.sync_store()
     while True:
         schedule.run_pending()
+        monitor.check_collect_request()
         time.sleep(1)
 
-# Start scheduler in background thread
-scheduler_thread = Thread(target=run_scheduler, daemon=True)
-scheduler_thread.start()
+def create_app(role=None):
+    """Start the monitor for a role (default LICSTATS_ROLE) and return the Flask app
+
+    Nothing here waits on lmstat or the logs directory: the first collection
+    and the store sync run in the background, and requests are answered from
+    the store meanwhile, so the server can bind right away.
+    """
+    global monitor, scheduler_thread
+    if monitor is not None:
+        return app
+    role = role or ROLE
+    if role not in ROLES:
+        raise ValueError(f"LICSTATS_ROLE must be one of {', '.join(ROLES)}, not {role!r}")
+    monitor = LicenseMonitor(role)
+
+    if role == 'web':
+        # The collector process collects; follow what it writes to the store
+        scheduler_thread = Thread(target=monitor.follow_store, daemon=True)
+    else:
+        # Run initial collection
+        monitor.trigger_collection()
+        scheduler_thread = Thread(target=run_scheduler, daemon=True)
+    scheduler_thread.start()
+    return app
+
+Gauge('licstats_sse_clients', 'Connected /api/events clients', function=lambda: monitor.events.client_count)
+Counter('licstats_view_cache_hits_total', 'Memoized view lookups served from the cache',
+        function=lambda: monitor.view_cache.hits)
+Counter('licstats_view_cache_misses_total', 'Memoized view lookups that computed the view',
+        function=lambda: monitor.view_cache.misses)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if PROFILING_ENABLED and request.args.get('profile') in ('1', 'true'):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
 
-# Run initial collection
-monitor.execute_lmstat()
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_SECONDS.observe(time.perf_counter() - g.request_started,
+                         route=route, method=request.method, status=response.status_code)
+    if not response.is_streamed:
+        HTTP_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, route=route)
+
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    # A streamed body is not produced yet; its profile covers the view only
+    response.close()
+    out = io.StringIO()
+    out.write(f"{request.method} {request.full_path} -> {response.status}\n\n")
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    return Response(out.getvalue(), mimetype='text/plain')
 
 # API Routes
+@app.route('/api/metrics')
+def get_metrics():
+    """Counters, gauges and histograms in the Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/status')
 def get_status():
     """Get system status"""
@@ -412,46 +1021,147 @@ def get_health():
 @app.route('/api/licenses')
 def get_licenses():
     """Get license data based on filter"""
-    time_filter = request.args.get('filter', 'latest')
-    data = monitor.get_aggregated_license_data(time_filter)
-    if not data or not data.get('licenses'):
-        return jsonify({'error': 'No data available for the selected period'}), 404
-    
-    return jsonify(data)
+    return paginated_view('licenses')
 
 @app.route('/api/logs')
 def get_logs():
-    """Get log files list"""
-    time_filter = request.args.get('filter', 'latest')
+    """List log files, newest first, for a filter or explicit from/to ISO timestamps"""
+    try:
+        time_filter = request_filter()
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO timestamps'}), 400
     files = monitor.get_log_files(time_filter)
-    
-    return jsonify({
-        'files': files,
-        'filter': time_filter
-    })
+
+    response = {'files': files, 'filter': request.args.get('filter', 'latest')}
+    if isinstance(time_filter, tuple):
+        response.update({'filter': 'range', 'from': request.args.get('from'), 'to': request.args.get('to')})
+    return jsonify(response)
 
 @app.route('/api/logs/<filename>')
 def get_log_content(filename):
     """Get specific log file content"""
-    filepath = os.path.join(LOGS_DIR, filename)
-    if not os.path.exists(filepath):
+    content = monitor.read_log_content(filename)
+    if content is None:
         return jsonify({'error': 'File not found'}), 404
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    licenses = monitor.parse_license_data(content)
+    entry = monitor.log_index.get(filename)
+    if entry is not None:
+        timestamp = entry['timestamp']
+    else:
+        # Not indexed yet: the time in its name, or its mtime for other .txt names
+        try:
+            timestamp = capture_time(os.path.join(LOGS_DIR, filename)).isoformat()
+        except OSError:
+            return jsonify({'error': 'File not found'}), 404
+
+    licenses = monitor.get_capture_licenses(filename, content)
     return jsonify({
         'filename': filename,
         'content': content,
         'licenses': licenses,
-        'timestamp': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
+        'timestamp': timestamp
     })
 
+@app.route('/api/raw_logs')
+def stream_raw_logs():
+    """Stream the raw captures of a window as NDJSON, oldest first
+
+    Each line is one {"filename", "timestamp", "content"} object. Accepts
+    filter=latest|week|month|all or explicit from/to ISO timestamps.
+    """
+    try:
+        files = monitor.get_log_files(request_filter())
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO timestamps'}), 400
+    files.reverse()
+    return Response(monitor.iter_raw_captures(files), mimetype='application/x-ndjson')
+
+@app.route('/api/export')
+def export_history():
+    """Stream usage or session history of a window as CSV or Parquet (see export.py)
+
+    Accepts dataset=usage|sessions, format=csv|parquet and filter=week|month|
+    year|all (default month) or explicit from/to ISO timestamps.
+    """
+    dataset = request.args.get('dataset', 'usage')
+    fmt = request.args.get('format', 'csv')
+    try:
+        start, end = request_window()
+        chunks = export(monitor.store, dataset, fmt, start, end)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+
+    span = '_'.join(point.strftime('%Y%m%d') for point in (start, end) if point)
+    filename = f"licstats_{dataset}{'_' + span if span else ''}.{fmt}"
+    return Response(chunks, content_type=EXPORT_CONTENT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/diff')
+def get_snapshot_diff():
+    """Feature count changes and sessions added/removed between two collection points
+
+    from/to are ISO timestamps (the snapshot at or before each is used) or
+    capture filenames; to defaults to the latest snapshot.
+    """
+    def point(value):
+        if value is None or value.endswith('.txt'):
+            return value
+        return datetime.fromisoformat(value)
+
+    if not request.args.get('from'):
+        return jsonify({'error': 'from is required'}), 400
+    try:
+        start, end = point(request.args.get('from')), point(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO timestamps or capture filenames'}), 400
+
+    diff = monitor.get_diff(start, end)
+    if diff is None:
+        return jsonify({'error': 'No snapshot at the requested point'}), 404
+    return jsonify(diff)
+
+@app.route('/api/events')
+def stream_events():
+    """Server-sent events replacing dashboard polling
+
+    'update' carries the features whose counts changed, users who checked
+    out or in, and the dashboard summary after each collection; 'status'
+    carries each health record; 'reset' asks the client to reload its data.
+    """
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    stream = monitor.events.subscribe(last_event_id, request.environ.get('waitress.client_disconnected'))
+    if stream is None:
+        # The client polls the JSON API instead and retries the stream later
+        response = jsonify({'error': f'Too many event streams (limit {MAX_SSE_CLIENTS})'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(RETRY_MILLISECONDS // 1000)
+        return response
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/collect')
 def manual_collect():
-    """Manually trigger data collection"""
-    success = monitor.execute_lmstat()
+    """Manually trigger data collection
+
+    Requests arriving while a collection is running join it. If it has not
+    finished within ?wait= seconds the response is 202 with in_progress set.
+    """
+    try:
+        wait = float(request.args.get('wait', COLLECT_WAIT_SECONDS))
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+
+    future = monitor.trigger_collection()
+    try:
+        success = future.result(timeout=max(wait, 0))
+    except FutureTimeoutError:
+        return jsonify({
+            'success': None,
+            'in_progress': True,
+            'timestamp': monitor.last_update.isoformat() if monitor.last_update else None
+        }), 202
     return jsonify({
         'success': success,
         'timestamp': monitor.last_update.isoformat() if monitor.last_update else None
@@ -460,72 +1170,144 @@ def manual_collect():
 @app.route('/api/users')
 def get_user_statistics():
     """Get user-based statistics based on filter"""
-    time_filter = request.args.get('filter', 'latest')
-    
-    if time_filter == 'latest':
-        data = monitor.get_latest_license_data()
-    else:
-        data = monitor.get_aggregated_license_data(time_filter)
-
-    if not data or not data.get('licenses'):
-        return jsonify({'error': 'No data available for the selected period'}), 404
-    
-    user_stats = monitor.get_user_statistics(data['licenses'])
-    
-    return jsonify({
-        'timestamp': data['timestamp'],
-        'users': user_stats,
-        'total_users': len(user_stats)
-    })
+    return paginated_view('users')
 
 @app.route('/api/modules')
 def get_module_statistics():
     """Get module-based statistics based on filter"""
-    time_filter = request.args.get('filter', 'latest')
-    data = monitor.get_aggregated_license_data(time_filter)
-    if not data or not data.get('licenses'):
-        return jsonify({'error': 'No data available for the selected period'}), 404
-    
-    module_stats = monitor.get_module_statistics(data['licenses'])
-    return jsonify({
-        'timestamp': data['timestamp'],
-        'modules': module_stats,
-        'total_active_modules': len(module_stats)
-    })
+    return paginated_view('modules')
 
 @app.route('/api/historical_summary')
 def get_historical_summary_data():
-    """Get historical summary data for charts."""
-    time_filter = request.args.get('filter', 'week') # default to last week
-    data = monitor.get_historical_summary(time_filter)
+    """Get historical summary data for charts, for a filter or explicit from/to ISO timestamps"""
+    try:
+        time_filter = request_filter('week')  # default to last week
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO timestamps'}), 400
+    resolution = request.args.get('resolution', 'auto')
+    feature = request.args.get('feature') or None
+    valid_resolutions = ['auto', 'raw'] + [name for name, _ in ROLLUP_RESOLUTIONS]
+    if resolution not in valid_resolutions:
+        return jsonify({'error': f"Invalid resolution, expected one of {', '.join(valid_resolutions)}"}), 400
+    if resolution == 'raw' and feature is not None:
+        # Per-snapshot points only hold the totals; per-feature trends come from the rollups
+        return jsonify({'error': 'resolution=raw does not support feature, use auto, minute, hour or day'}), 400
+
+    data = monitor.get_historical_summary(time_filter, resolution, feature)
     return jsonify(data)
 
 @app.route('/api/realtime_stats')
 def get_realtime_stats():
     """Get latest user and license counts for real-time chart"""
-    data = monitor.get_latest_license_data()
-    if not data or not data.get('licenses'):
+    data = monitor.get_realtime_stats()
+    if not data:
         return jsonify({
             'timestamp': datetime.now().isoformat(),
             'total_licenses_in_use': 0,
             'total_users': 0
         })
 
-    licenses = data['licenses']
-    total_licenses_in_use = sum(l.get('in_use', 0) for l in licenses)
-    
-    user_set = set()
-    for license_data in licenses:
-        for user in license_data.get('users', []):
-            user_set.add(user['user'])
-    total_users = len(user_set)
+    return jsonify(data)
+
+@app.route('/api/sessions')
+def get_sessions():
+    """List reconstructed checkout sessions overlapping a time window"""
+    try:
+        start, end = request_window()
+        limit = int(request.args.get('limit', DEFAULT_SESSIONS_LIMIT))
+        if not 1 <= limit <= MAX_SESSIONS_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_SESSIONS_LIMIT}')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+
+    sessions = monitor.sessions.sessions(
+        start, end,
+        user=request.args.get('user'),
+        feature=request.args.get('feature'),
+        open_only=request.args.get('open') in ('1', 'true'),
+        limit=limit)
+    return jsonify({'sessions': sessions, 'count': len(sessions)})
+
+@app.route('/api/session_report')
+def get_session_report():
+    """Per-user, per-feature or per-host checkout durations over a time window"""
+    group_by = request.args.get('group_by', 'user')
+    try:
+        start, end = request_window()
+        report = monitor.sessions.report(group_by, start, end,
+                                         user=request.args.get('user'),
+                                         feature=request.args.get('feature'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'group_by': group_by,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'report': report
+    })
+
+@app.route('/api/capacity')
+def get_capacity():
+    """Per-feature utilization percentiles, time at capacity and seats needed for a demand coverage
+
+    /api/capacity?filter=year&coverage=95, or feature=A,B&heatmap=1 for
+    hour-of-week heatmaps of selected features.
+    """
+    try:
+        start, end = request_window('year')
+        coverage = float(request.args.get('coverage', DEFAULT_COVERAGE))
+        features = query_list('feature')
+        heatmap = request.args.get('heatmap') in ('1', 'true')
+        window = (request.args.get('filter', 'year'), request.args.get('from'), request.args.get('to'))
+        report = monitor.get_capacity_report(window, start, end, features, coverage, heatmap)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'coverage': coverage,
+        'features': report
+    })
+
+@app.route('/api/query')
+def query_sessions():
+    """Checkout totals filtered by user/host/feature and time, grouped and ranked
+
+    user, host, feature and group_by take comma-separated lists, e.g.
+    /api/query?feature=MSC_NASTRAN,PATRAN&group_by=user,host&top=10
+    """
+    try:
+        start, end = request_window()
+        group_by = query_list('group_by') or []
+        sort = request.args.get('sort', 'total_duration_minutes')
+        top = int(request.args.get('top', DEFAULT_QUERY_TOP))
+        if not 1 <= top <= MAX_QUERY_TOP:
+            raise ValueError(f'top must be between 1 and {MAX_QUERY_TOP}')
+        results, total = monitor.sessions.query(start, end,
+                                                user=query_list('user'),
+                                                host=query_list('host'),
+                                                feature=query_list('feature'),
+                                                group_by=group_by, sort=sort, top=top)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify({
-        'timestamp': data['timestamp'],
-        'total_licenses_in_use': total_licenses_in_use,
-        'total_users': total_users
+        'group_by': group_by,
+        'sort': sort,
+        'top': top,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'total_groups': total,
+        'results': results
     })
 
+def query_list(name):
+    """Comma-separated request argument as a list, None when absent"""
+    values = [v.strip() for v in request.args.get(name, '').split(',') if v.strip()]
+    return values or None
+
 # Serve frontend
 @app.route('/')
 def serve_frontend():
@@ -542,5 +1324,8 @@ if __name__ == '__main__':
     print(f"Debug mode: {DEBUG_MODE}")
     print(f"Update interval: {UPDATE_INTERVAL} minutes")
     print(f"Logs directory: {LOGS_DIR}")
-    
+
+    # The reloader's watching parent runs this too; only the serving child monitors
+    if is_running_from_reloader():
+        create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
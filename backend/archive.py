@@ -0,0 +1,276 @@
+"""Append-only compressed archive of raw lmstat captures
+
+Each day's captures go into one segment file, logs/archive/YYYYMMDD.seg, as
+independent zlib frames. A sidecar YYYYMMDD.idx holds one tab-separated line
+per capture: filename, offset, compressed length, uncompressed size. Only the
+index of the days being listed or read is loaded.
+
+Web processes read the archive the collector process writes, so a cached
+index is checked against its file on every use: lines appended since are
+read in, and a file replaced by compact() is loaded afresh.
+
+Usage (from backend/):
+    python archive.py migrate [--keep]      move plain logs/*.txt into segments
+    python archive.py compact               rewrite past segments, dropping orphaned bytes
+    python archive.py prune --days 365      delete segments older than N days
+"""
+import argparse
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+CAPTURE_FORMAT = "%Y%m%d_%H%M%S.txt"
+COMPRESSION_LEVEL = 6
+COMPACT_COMPRESSION_LEVEL = 9
+
+
+class CaptureArchive:
+    """Per-day compressed segments of raw captures, addressed by capture filename"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        # 'YYYYMMDD' -> (inode of the .idx, bytes of it read, {filename: (offset, length, size)})
+        self._days = {}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _paths(self, day):
+        base = os.path.join(self.directory, day)
+        return base + '.seg', base + '.idx'
+
+    def segment_days(self):
+        """Return the days that have a segment, oldest first"""
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.idx'))
+
+    def _day_index(self, day):
+        """Load (and cache) the offset index of one day, following changes to its file"""
+        _, idx_path = self._paths(day)
+        try:
+            stat = os.stat(idx_path)
+        except FileNotFoundError:
+            self._days.pop(day, None)
+            return {}
+
+        cached = self._days.get(day)
+        if cached is not None and cached[0] == stat.st_ino and cached[1] <= stat.st_size:
+            inode, position, index = cached
+            if position == stat.st_size:
+                return index
+        else:
+            # First use, or rewritten by compact() (possibly in another process)
+            inode, position, index = stat.st_ino, 0, {}
+
+        with open(idx_path, 'rb') as f:
+            f.seek(position)
+            data = f.read()
+        # A line without its newline is still being appended; it is read next time
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].decode('utf-8').splitlines():
+            parts = line.split('\t')
+            if len(parts) != 4:
+                # Torn write from an interrupted append
+                continue
+            filename, offset, length, size = parts
+            index[filename] = (int(offset), int(length), int(size))
+        self._days[day] = (inode, position + complete, index)
+        return index
+
+    def has(self, filename):
+        if not is_capture_name(filename):
+            return False
+        with self._lock:
+            return filename in self._day_index(filename[:8])
+
+    def append(self, filename, content):
+        """Compress one capture onto the end of its day's segment"""
+        day = filename[:8]
+        data = content.encode('utf-8')
+        frame = zlib.compress(data, COMPRESSION_LEVEL)
+        seg_path, idx_path = self._paths(day)
+
+        with self._lock:
+            with open(seg_path, 'ab') as seg:
+                offset = seg.tell()
+                seg.write(frame)
+            # The index line is written last, so a crash leaves at worst
+            # unreferenced bytes in the segment, which compact() drops. The
+            # cache picks the line up from the file on its next use.
+            with open(idx_path, 'a', encoding='utf-8') as idx:
+                idx.write(f"{filename}\t{offset}\t{len(frame)}\t{len(data)}\n")
+
+    def read(self, filename):
+        """Return the decompressed capture, or None if it is not archived"""
+        if not is_capture_name(filename):
+            return None
+        day = filename[:8]
+        with self._lock:
+            for attempt in range(2):
+                entry = self._day_index(day).get(filename)
+                if entry is None:
+                    return None
+                offset, length, size = entry
+                seg_path, _ = self._paths(day)
+                with open(seg_path, 'rb') as seg:
+                    seg.seek(offset)
+                    frame = seg.read(length)
+                try:
+                    data = zlib.decompress(frame)
+                    if len(data) == size:
+                        return data.decode('utf-8')
+                except zlib.error:
+                    pass
+                # The segment was compacted by another process after its index
+                # was read: reload the index and read again
+                self._days.pop(day, None)
+        raise zlib.error(f"Archived capture {filename} does not match its index")
+
+    def list_captures(self, start=None, end=None):
+        """List archived captures in [start, end) (unbounded when None), newest first"""
+        first_day = start.strftime('%Y%m%d') if start else ''
+        last_day = end.strftime('%Y%m%d') if end else None
+        captures = []
+        with self._lock:
+            for day in self.segment_days():
+                if day < first_day or (last_day and day > last_day):
+                    continue
+                for filename, (_, length, size) in self._day_index(day).items():
+                    timestamp = datetime.strptime(filename, CAPTURE_FORMAT)
+                    if (start and timestamp < start) or (end and timestamp >= end):
+                        continue
+                    captures.append({
+                        'filename': filename,
+                        'timestamp': timestamp.isoformat(),
+                        'size': size,
+                        'compressed_size': length,
+                        'archived': True
+                    })
+        captures.sort(key=lambda x: x['timestamp'], reverse=True)
+        return captures
+
+    def latest_capture(self):
+        """Return the newest archived capture entry, or None"""
+        with self._lock:
+            for day in reversed(self.segment_days()):
+                index = self._day_index(day)
+                if index:
+                    filename = max(index)
+                    _, length, size = index[filename]
+                    return {
+                        'filename': filename,
+                        'timestamp': datetime.strptime(filename, CAPTURE_FORMAT).isoformat(),
+                        'size': size,
+                        'compressed_size': length,
+                        'archived': True
+                    }
+        return None
+
+    def compact(self, day):
+        """Rewrite one segment in capture order at a higher compression level"""
+        seg_path, idx_path = self._paths(day)
+        with self._lock:
+            index = self._day_index(day)
+            if not index:
+                return 0
+            new_index = {}
+            with open(seg_path, 'rb') as src, open(seg_path + '.tmp', 'wb') as dst, \
+                    open(idx_path + '.tmp', 'w', encoding='utf-8') as idx:
+                for filename in sorted(index):
+                    offset, length, size = index[filename]
+                    src.seek(offset)
+                    data = zlib.decompress(src.read(length))
+                    frame = zlib.compress(data, COMPACT_COMPRESSION_LEVEL)
+                    new_offset = dst.tell()
+                    dst.write(frame)
+                    idx.write(f"{filename}\t{new_offset}\t{len(frame)}\t{size}\n")
+                    new_index[filename] = (new_offset, len(frame), size)
+            os.replace(seg_path + '.tmp', seg_path)
+            os.replace(idx_path + '.tmp', idx_path)
+            self._days.pop(day, None)
+            return len(new_index)
+
+    def compact_before(self, before):
+        """Compact every segment of a day earlier than before (the active day is left alone)"""
+        last_day = before.strftime('%Y%m%d')
+        return sum(self.compact(day) for day in self.segment_days() if day < last_day)
+
+    def prune(self, before):
+        """Delete whole segments of days earlier than before; returns captures removed"""
+        last_day = before.strftime('%Y%m%d')
+        removed = 0
+        with self._lock:
+            for day in self.segment_days():
+                if day >= last_day:
+                    break
+                removed += len(self._day_index(day))
+                for path in self._paths(day):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._days.pop(day, None)
+        return removed
+
+    def migrate(self, logs_dir, keep=False, before=None):
+        """Move plain YYYYMMDD_HHMMSS.txt captures from logs_dir into segments
+
+        Only captures older than before (default: all) are moved; originals
+        are deleted once archived unless keep is set.
+        """
+        migrated = 0
+        for filename in sorted(os.listdir(logs_dir)):
+            try:
+                timestamp = datetime.strptime(filename, CAPTURE_FORMAT)
+            except ValueError:
+                continue
+            if before and timestamp >= before:
+                continue
+
+            filepath = os.path.join(logs_dir, filename)
+            if not self.has(filename):
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    self.append(filename, f.read())
+                migrated += 1
+            if not keep:
+                os.remove(filepath)
+        return migrated
+
+
+def is_capture_name(filename):
+    """True for names of the form YYYYMMDD_HHMMSS.txt"""
+    try:
+        datetime.strptime(filename, CAPTURE_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logs-dir', default='logs')
+    parser.add_argument('--archive-dir', default=None, help='default: <logs-dir>/archive')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='move plain captures into segments')
+    migrate_parser.add_argument('--keep', action='store_true', help='keep the original .txt files')
+    subparsers.add_parser('compact', help='compact every segment before today')
+    prune_parser = subparsers.add_parser('prune', help='delete segments older than --days')
+    prune_parser.add_argument('--days', type=int, required=True)
+    args = parser.parse_args()
+
+    archive = CaptureArchive(args.archive_dir or os.path.join(args.logs_dir, 'archive'))
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if args.command == 'migrate':
+        count = archive.migrate(args.logs_dir, keep=args.keep)
+        print(f"Migrated {count} captures into {archive.directory}")
+    elif args.command == 'compact':
+        count = archive.compact_before(today)
+        print(f"Compacted {count} captures")
+    elif args.command == 'prune':
+        count = archive.prune(today - timedelta(days=args.days))
+        print(f"Pruned {count} captures older than {args.days} days")
+
+
+if __name__ == '__main__':
+    main()
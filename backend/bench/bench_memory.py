@@ -0,0 +1,99 @@
+"""Memory benchmark: bytes per held snapshot, dict form against compact snapshots
+
+Parses a run of synthetic captures, each from its own text like the
+collector does, where consecutive captures share most checkouts. Measures
+with tracemalloc what holding them costs as parse_license_data dicts and as
+a compact SnapshotWindow (symbol table included), then times replaying the
+run from the window against decoding it from a store's delta frames.
+
+Usage (from backend/):
+    python bench/bench_memory.py
+    python bench/bench_memory.py --snapshots 1440 --features 300 --user-lines 400
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compact import SnapshotWindow
+from diff import snapshot_state
+from lmstat_parser import parse_license_data
+from store import SnapshotStore
+from synth import generate_dump
+
+
+def captures(count, features, user_lines, variants):
+    """(timestamp, text) of one capture per minute ending now, cycling a few dumps"""
+    dumps = [generate_dump(features, user_lines, seed=seed) for seed in range(variants)]
+    start = datetime.now() - timedelta(minutes=count)
+    # Runs of identical captures, like checkouts that stay open between polls
+    run = max(1, count // (variants * 4))
+    return [(start + timedelta(minutes=i), dumps[(i // run) % variants]) for i in range(count)]
+
+
+def measure(build):
+    """(bytes still allocated after build(), its result)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshots', type=int, default=1440, help='captures held (1440 = a day at 1 minute)')
+    parser.add_argument('--features', type=int, default=200, help='features per capture')
+    parser.add_argument('--user-lines', type=int, default=300, help='checkouts per capture')
+    parser.add_argument('--variants', type=int, default=8, help='distinct captures cycled through')
+    args = parser.parse_args()
+
+    run = captures(args.snapshots, args.features, args.user_lines, args.variants)
+    print(f'{args.snapshots} captures, {args.features} features, {args.user_lines} checkouts each')
+
+    dict_bytes, parsed = measure(lambda: [parse_license_data(text) for _, text in run])
+
+    def build_window():
+        window = SnapshotWindow(hours=args.snapshots / 60 + 1)
+        for i, (timestamp, text) in enumerate(run):
+            window.add(i + 1, timestamp, snapshot_state(parse_license_data(text)))
+        return window
+    compact_bytes, window = measure(build_window)
+
+    n = args.snapshots
+    print(f'{"":<22}{"total MB":>10}{"bytes/snapshot":>16}')
+    print(f'{"dict form":<22}{dict_bytes / 1e6:>10.1f}{dict_bytes / n:>16,.0f}')
+    print(f'{"compact window":<22}{compact_bytes / 1e6:>10.1f}{compact_bytes / n:>16,.0f}')
+    print(f'  columns {window.nbytes() / n:,.0f} bytes/snapshot, {len(window.symbols)} symbols; '
+          f'{dict_bytes / compact_bytes:.1f}x smaller')
+
+    # The window must give back what was parsed
+    for (_, _, licenses), expected in zip(window.replay(), parsed):
+        assert licenses == expected, 'compact snapshot differs from the parsed capture'
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(os.path.join(directory, 'bench.db'))
+        store.add_snapshots((timestamp, f'{i}.txt', licenses)
+                            for i, ((timestamp, _), licenses) in enumerate(zip(run, parsed)))
+        del parsed
+        started = time.perf_counter()
+        replayed = sum(1 for _ in store.replay())
+        frames = time.perf_counter() - started
+        started = time.perf_counter()
+        sum(1 for _ in window.replay())
+        memory = time.perf_counter() - started
+        print(f'replay {replayed} snapshots: frames {frames * 1000:.0f} ms, '
+              f'compact window {memory * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
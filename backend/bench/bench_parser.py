@@ -0,0 +1,116 @@
+"""Parser throughput benchmark: lmstat_parser vs the original line-by-line parser
+
+Usage (from backend/):
+    python bench/bench_parser.py
+    python bench/bench_parser.py --features 1000 10000 50000 --users 5000 --repeat 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lmstat_parser import parse_license_data
+from synth import TEMPLATE_FILE, generate_dump
+
+
+def legacy_parse_license_data(content):
+    """The original LicenseMonitor.parse_license_data, kept as the reference implementation"""
+    licenses = []
+    lines = content.split('\n')
+
+    current_feature = None
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+
+        feature_match = re.match(r'Users of ([^:]+):\s+\(Total of (\d+) licenses issued;\s+Total of (\d+) licenses? in use\)', line)
+        if feature_match:
+            feature_name = feature_match.group(1)
+            total_licenses = int(feature_match.group(2))
+            licenses_in_use = int(feature_match.group(3))
+
+            current_feature = {
+                'feature': feature_name,
+                'total': total_licenses,
+                'in_use': licenses_in_use,
+                'available': total_licenses - licenses_in_use,
+                'users': []
+            }
+            licenses.append(current_feature)
+
+            if licenses_in_use > 0:
+                j = i + 1
+                while j < len(lines) and not lines[j].strip().startswith('Users of'):
+                    detail_line = lines[j].strip()
+
+                    user_match = re.match(r'^(\w+)\s+([^\s]+)\s+.*?\(([^)]+)\),\s*start\s+(.+?)\s*\(linger:\s*(\d+)\)', detail_line)
+                    if user_match:
+                        current_feature['users'].append({
+                            'user': user_match.group(1),
+                            'host': user_match.group(2),
+                            'connection': user_match.group(3),
+                            'start_time': user_match.group(4),
+                            'linger': user_match.group(5),
+                            'details': detail_line
+                        })
+
+                    j += 1
+                    if j < len(lines) and lines[j].strip().startswith('Users of'):
+                        break
+
+                i = j - 1
+
+        i += 1
+
+    return licenses
+
+
+def time_parser(parse, content, repeat):
+    """Return the best wall time of repeat runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_fixture(name, content):
+    expected = legacy_parse_license_data(content)
+    actual = parse_license_data(content)
+    if actual != expected:
+        raise SystemExit(f'MISMATCH on {name}: parsers disagree')
+    return len(actual), sum(len(l['users']) for l in actual)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--features', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+    parser.add_argument('--users', type=int, default=2000, help='user lines per synthetic dump')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(TEMPLATE_FILE, 'r', encoding='utf-8') as f:
+        fixtures = [('234.txt', f.read())]
+    for count in args.features:
+        fixtures.append((f'synthetic {count} features / {args.users} users',
+                         generate_dump(count, args.users, seed=args.seed)))
+
+    print(f"{'fixture':<40} {'size':>9} {'legacy MB/s':>12} {'new MB/s':>10} "
+          f"{'legacy f/s':>11} {'new f/s':>9} {'speedup':>8}")
+    for name, content in fixtures:
+        features, users = check_fixture(name, content)
+        size_mb = len(content.encode('utf-8')) / 1e6
+        legacy = time_parser(legacy_parse_license_data, content, args.repeat)
+        new = time_parser(parse_license_data, content, args.repeat)
+        print(f'{name:<40} {size_mb:>7.2f}MB {size_mb / legacy:>12.1f} {size_mb / new:>10.1f} '
+              f'{1 / legacy:>11.1f} {1 / new:>9.1f} {legacy / new:>7.1f}x')
+        print(f'{"":<40} ok: {features} features, {users} user lines match')
+
+
+if __name__ == '__main__':
+    main()
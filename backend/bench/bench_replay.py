@@ -0,0 +1,246 @@
+"""End-to-end ingest replay under concurrent API load
+
+Synthesizes a captures history from 234.txt (synth.simulate_history: users
+checking features out and in over office hours, features scaled to
+--features), then starts a replay server in a fresh working directory: the
+app's LicenseMonitor behind a threaded Werkzeug server, fed the history
+through the collector's ingest path (_store_capture, which writes logs/,
+the store, sessions and the log index) with each capture's own timestamp,
+as fast as it goes or at --rate captures per second.
+
+While the history is ingested, --clients clients per endpoint request the
+API continuously; after it, they do so for another --duration seconds
+against the full history. Reported: ingest rate, p50/p99 latency per
+endpoint in both phases, and the server's RSS as the history grows.
+
+Usage (from backend/):
+    python bench/bench_replay.py
+    python bench/bench_replay.py --days 180 --interval 1 --features 300 --users 800 --peak-sessions 600
+    python bench/bench_replay.py --history /tmp/history --days 30   reuses a history written earlier
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND)
+
+from load_test import client, percentile
+from synth import simulate_history
+
+LOG_FILENAME_FORMAT = "%Y%m%d_%H%M%S.txt"
+DEFAULT_PATHS = ('/api/licenses', '/api/users?filter=week', '/api/modules?filter=month',
+                 '/api/historical_summary?filter=month')
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where it cannot be read"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def write_history(directory, days, interval, features, users, peak_sessions, seed):
+    """Write one capture every interval minutes over the last days; returns the capture count"""
+    os.makedirs(directory, exist_ok=True)
+    step = timedelta(minutes=interval)
+    captures = int(timedelta(days=days) / step)
+    start = (datetime.now() - step * captures).replace(microsecond=0)
+    for timestamp, capture in simulate_history(start, captures, step, features, users, peak_sessions, seed=seed):
+        with open(os.path.join(directory, timestamp.strftime(LOG_FILENAME_FORMAT)), 'w', encoding='utf-8') as f:
+            f.write(capture)
+    return captures
+
+
+def serve_replay(history, port, rate, progress_every):
+    """Replay server (run in a subprocess): JSON event lines on stdout, commands on stdin"""
+    protocol = sys.stdout
+    # The app logs every capture; keep that out of the event stream
+    sys.stdout = open(os.devnull, 'w')
+
+    def report(event, **fields):
+        protocol.write(json.dumps(dict(fields, event=event, rss=rss_bytes())) + '\n')
+        protocol.flush()
+
+    from werkzeug.serving import make_server
+    import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    monitor = app.LicenseMonitor('all')
+    app.monitor = monitor
+    monitor.keep_recent_snapshots()
+
+    files = sorted(f for f in os.listdir(history) if f.endswith('.txt'))
+    source = app.LMSTAT_SERVERS[0]
+
+    def ingest(filename):
+        with open(os.path.join(history, filename), 'r', encoding='utf-8') as f:
+            content = f.read()
+        monitor._store_capture([(source, content)], timestamp=datetime.strptime(filename, LOG_FILENAME_FORMAT))
+        return len(content)
+
+    # The first capture goes in before the clients start, so they never see an empty store
+    total_bytes = ingest(files[0])
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    report('ready')
+
+    sys.stdin.readline()
+    started = time.perf_counter()
+    for i, filename in enumerate(files[1:], 1):
+        total_bytes += ingest(filename)
+        if rate:
+            time.sleep(max(0.0, started + i / rate - time.perf_counter()))
+        if i % progress_every == 0:
+            report('progress', captures=i, elapsed=time.perf_counter() - started)
+    report('done', captures=len(files) - 1, bytes=total_bytes, elapsed=time.perf_counter() - started)
+
+    for line in sys.stdin:
+        if line.strip() == 'rss':
+            report('rss')
+        else:
+            break
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_clients(port, paths, clients, deadline, stop):
+    """Client threads per path; returns (threads, {path: results})"""
+    results = {path: [] for path in paths}
+    threads = [threading.Thread(target=client, args=('127.0.0.1', port, path, deadline, results[path], stop))
+               for path in paths for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def summarize(results, elapsed):
+    """{path: (requests/s, p50 ms, p99 ms, errors)}"""
+    summary = {}
+    for path, per_client in results.items():
+        latencies = sorted(latency for client_latencies, _ in per_client for latency in client_latencies)
+        errors = sum(client_errors for _, client_errors in per_client)
+        summary[path] = (len(latencies) / elapsed, percentile(latencies, 50) * 1000,
+                         percentile(latencies, 99) * 1000, errors)
+    return summary
+
+
+def megabytes(value):
+    return f'{value / 1e6:.0f} MB' if value is not None else 'n/a'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=7.0, help='history length')
+    parser.add_argument('--interval', type=float, default=1.0, help='minutes between captures')
+    parser.add_argument('--features', type=int, default=200)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--peak-sessions', type=int, default=300, help='checkouts open at office-hours peak')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=None, help='directory of captures to reuse or fill (default: temporary)')
+    parser.add_argument('--rate', type=float, default=0.0, help='captures ingested per second; 0 = as fast as possible')
+    parser.add_argument('--path', action='append', help='endpoint to load (repeatable)')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients per endpoint')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load after the ingest')
+    parser.add_argument('--progress-every', type=int, default=1000, help='captures between progress lines')
+    parser.add_argument('--serve-replay', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_replay:
+        serve_replay(args.serve_replay, args.port, args.rate, args.progress_every)
+        return
+
+    paths = args.path or DEFAULT_PATHS
+    with tempfile.TemporaryDirectory() as workdir:
+        history = args.history or os.path.join(workdir, 'history')
+        if os.path.isdir(history) and any(f.endswith('.txt') for f in os.listdir(history)):
+            print(f'reusing the captures in {history}')
+        else:
+            started = time.perf_counter()
+            count = write_history(history, args.days, args.interval, args.features, args.users,
+                                  args.peak_sessions, args.seed)
+            print(f'wrote {count} captures to {history} in {time.perf_counter() - started:.1f}s')
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve-replay', os.path.abspath(history),
+             '--port', str(port), '--rate', str(args.rate), '--progress-every', str(args.progress_every)],
+            cwd=workdir, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+        def event():
+            line = server.stdout.readline()
+            if not line:
+                raise SystemExit(f'replay server exited with code {server.wait()}')
+            return json.loads(line)
+
+        def command(line):
+            server.stdin.write(line + '\n')
+            server.stdin.flush()
+
+        try:
+            baseline = event()['rss']
+            print(f'server ready, RSS {megabytes(baseline)}')
+
+            stop = threading.Event()
+            threads, during = start_clients(port, paths, args.clients, float('inf'), stop)
+            started = time.perf_counter()
+            command('go')
+            print(f"{'captures':>9} {'captures/s':>11} {'RSS':>9}")
+            while True:
+                e = event()
+                if e['event'] == 'done':
+                    break
+                print(f"{e['captures']:>9} {e['captures'] / e['elapsed']:>11.1f} {megabytes(e['rss']):>9}")
+            stop.set()
+            for thread in threads:
+                thread.join()
+            during = summarize(during, time.perf_counter() - started)
+            ingested = e
+
+            threads, after = start_clients(port, paths, args.clients, time.perf_counter() + args.duration, None)
+            for thread in threads:
+                thread.join()
+            after = summarize(after, args.duration)
+            command('rss')
+            final_rss = event()['rss']
+        finally:
+            if server.poll() is None:
+                server.stdin.close()
+                server.wait()
+
+    print(f"\ningested {ingested['captures']} captures ({ingested['bytes'] / 1e6:.0f} MB) in "
+          f"{ingested['elapsed']:.1f}s: {ingested['captures'] / ingested['elapsed']:.1f} captures/s, "
+          f"{ingested['bytes'] / 1e6 / ingested['elapsed']:.1f} MB/s")
+    if baseline is not None and final_rss is not None:
+        growth = final_rss - baseline
+        print(f'RSS {megabytes(baseline)} -> {megabytes(final_rss)} (+{growth / 1e6:.0f} MB, '
+              f'{growth / max(ingested["captures"], 1) / 1e3:.1f} KB per capture)')
+
+    print(f"\n{'endpoint':<40} {'phase':<7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for path in paths:
+        for phase, summary in (('ingest', during), ('after', after)):
+            rps, p50, p99, errors = summary[path]
+            print(f'{path:<40} {phase:<7} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {errors:>7}')
+
+
+if __name__ == '__main__':
+    main()
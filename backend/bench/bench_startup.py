@@ -0,0 +1,137 @@
+"""Startup benchmark: time to first response of a fresh server process
+
+Fills a temporary logs/ directory with synthetic captures, then starts the
+app (role 'all', threaded Werkzeug server) in a subprocess twice: a first
+boot with no store, which indexes and ingests every capture in the
+background, and a restart with the store and log index in place. For each
+it reports the seconds from process spawn until the server answers
+(/api/status), has license data (/api/licenses), lists every capture
+(/api/logs?filter=all) and has every capture in the store. It then times
+loading the persisted log index against listing and stat'ing the directory.
+
+Usage (from backend/):
+    python bench/bench_startup.py
+    python bench/bench_startup.py --files 20000
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND)
+
+from logindex import LogIndex
+from store import SnapshotStore
+from synth import generate_dump
+
+LOG_FILENAME_FORMAT = "%Y%m%d_%H%M%S.txt"
+# (column, endpoint, whether a response body shows the stage is reached given the capture count)
+STAGES = (
+    ('answers', '/api/status', lambda body, files: True),
+    ('has data', '/api/licenses', lambda body, files: True),
+    ('lists logs', '/api/logs?filter=all', lambda body, files: len(body['files']) >= files),
+    ('ingested', '/api/historical_summary?filter=all&resolution=raw', lambda body, files: len(body) >= files)
+)
+
+SERVER = """
+import sys
+sys.path.insert(0, {backend!r})
+from werkzeug.serving import make_server
+import app
+make_server('127.0.0.1', {port}, app.create_app('all'), threaded=True).serve_forever()
+"""
+
+
+def write_logs(directory, files, features, user_lines):
+    """One capture per minute up to now, cycling a few synthetic dumps"""
+    os.makedirs(directory)
+    dumps = [generate_dump(features, user_lines, seed=seed) for seed in range(10)]
+    start = datetime.now() - timedelta(minutes=files)
+    for i in range(files):
+        filename = (start + timedelta(minutes=i)).strftime(LOG_FILENAME_FORMAT)
+        with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+            f.write(dumps[i % len(dumps)])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_to_stages(workdir, files, timeout):
+    """Seconds from spawning the server to reaching each stage"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-c', SERVER.format(backend=BACKEND, port=port)], cwd=workdir,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {}
+    try:
+        for stage, path, reached in STAGES:
+            while True:
+                if time.perf_counter() - started > timeout:
+                    raise SystemExit(f'{stage} ({path}) not reached within {timeout}s')
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=timeout) as response:
+                        if reached(json.loads(response.read()), files):
+                            break
+                except (urllib.error.URLError, ConnectionError):
+                    pass
+                # Poll the later, heavier stages gently so the server's background work is not slowed
+                time.sleep(0.01 if stage == 'answers' else 0.2)
+            timings[stage] = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    return timings
+
+
+def directory_scan(directory):
+    """What get_log_files did on every request before the index"""
+    files = []
+    for filename in os.listdir(directory):
+        if filename.endswith('.txt'):
+            filepath = os.path.join(directory, filename)
+            files.append((filename, datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat(),
+                          os.path.getsize(filepath)))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=5000, help='captures in logs/')
+    parser.add_argument('--features', type=int, default=50, help='features per capture')
+    parser.add_argument('--user-lines', type=int, default=40, help='checkouts per capture')
+    parser.add_argument('--timeout', type=float, default=600.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        logs_dir = os.path.join(workdir, 'logs')
+        write_logs(logs_dir, args.files, args.features, args.user_lines)
+        print(f'{args.files} captures in {logs_dir}')
+
+        print(f"{'':<10}" + ''.join(f'{stage:>12}' for stage, _, _ in STAGES))
+        for run in ('first boot', 'restart'):
+            timings = time_to_stages(workdir, args.files, args.timeout)
+            print(f'{run:<10}' + ''.join(f'{timings[stage]:>11.2f}s' for stage, _, _ in STAGES))
+
+        started = time.perf_counter()
+        scanned = directory_scan(logs_dir)
+        scan = time.perf_counter() - started
+        started = time.perf_counter()
+        index = LogIndex(SnapshotStore(os.path.join(workdir, 'licstats.db'), migrate=False), logs_dir)
+        load = time.perf_counter() - started
+        print(f'list + stat {len(scanned)} files: {scan * 1000:.0f} ms; '
+              f'load log index ({len(index.entries())} entries): {load * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
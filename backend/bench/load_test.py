@@ -0,0 +1,95 @@
+"""Requests/sec of the API under concurrent clients
+
+Each client is a thread with its own keep-alive connection that requests
+one endpoint as fast as the server answers for --duration seconds. Start
+the server first, e.g. python serve.py (or python app.py to compare with the
+dev server), then from backend/:
+
+    python bench/load_test.py
+    python bench/load_test.py --url http://127.0.0.1:5000 --concurrency 1 4 16 64 --duration 10
+    python bench/load_test.py --path "/api/licenses?filter=week" --path /api/users
+
+The client threads share one interpreter, so when the client machine rather
+than the server is the bottleneck, run several copies of this script.
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ('/api/licenses', '/api/realtime_stats')
+
+
+def client(host, port, path, deadline, results, stop=None):
+    """Request path until the deadline or until stop (an Event) is set; appends (latencies, errors)"""
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    while time.perf_counter() < deadline and not (stop and stop.is_set()):
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    results.append((latencies, errors))
+
+
+def run(host, port, path, concurrency, duration):
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(host, port, path, deadline, results))
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+    errors = sum(thread_errors for _, thread_errors in results)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--path', action='append', help='endpoint to load (repeatable)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per endpoint and concurrency')
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    print(f"{'endpoint':<32} {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for path in args.path or DEFAULT_PATHS:
+        for concurrency in args.concurrency:
+            result = run(host, port, path, concurrency, args.duration)
+            print(f"{path:<32} {concurrency:>7} {result['rps']:>9.1f} {result['p50_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Synthetic lmstat output built from the 234.txt capture"""
+import os
+import random
+import re
+
+TEMPLATE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '234.txt'))
+
+HEADER_RE = re.compile(r'^Users of ([^:]+):', re.MULTILINE)
+
+
+def load_template(path=TEMPLATE_FILE):
+    """Split the template capture into its preamble and the feature names it lists"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    marker = 'Feature usage info:'
+    preamble = content[:content.index(marker) + len(marker)] + '\n\n'
+    return preamble, HEADER_RE.findall(content)
+
+
+def feature_names(template_features, count):
+    """Return count unique feature names, cycling the template names with suffixes"""
+    names = []
+    for i in range(count):
+        base = template_features[i % len(template_features)]
+        round_ = i // len(template_features)
+        names.append(base if round_ == 0 else f'{base}_{round_}')
+    return names
+
+
+def format_header(feature, total, in_use):
+    plural = 'license' if in_use == 1 else 'licenses'
+    return f'Users of {feature}:  (Total of {total} licenses issued;  Total of {in_use} {plural} in use)\n\n'
+
+
+def format_user(user, host, handle, start='Mon 7/7 9:47', linger=10367880, server='HQCNDB/29000'):
+    return (f'    {user} {host} {host}0.0 (v1.0) ({server} {handle}), '
+            f'start {start} (linger: {linger})\n')
+
+
+def build_dump(preamble, features):
+    """Render a capture from an ordered {feature: (total, [(user, host, handle, start), ...])}"""
+    parts = [preamble]
+    for feature, (total, sessions) in features.items():
+        parts.append(format_header(feature, total, len(sessions)))
+        if sessions:
+            parts.append(f'  "{feature}" v2024.12, vendor: ugslmd\n  floating license\n\n')
+            for user, host, handle, start in sessions:
+                parts.append(format_user(user, host, handle, start))
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def generate_dump(num_features, num_user_lines, seed=0, num_users=None, path=TEMPLATE_FILE):
+    """Generate one synthetic capture with num_features features and num_user_lines user lines"""
+    rng = random.Random(seed)
+    preamble, template_features = load_template(path)
+    names = feature_names(template_features, num_features)
+    num_users = num_users or max(1, num_user_lines // 4)
+    users = [f'user{i:04d}' for i in range(num_users)]
+
+    sessions = {name: [] for name in names}
+    handle = 8801
+    for _ in range(num_user_lines):
+        feature = names[rng.randrange(len(names))]
+        user = users[rng.randrange(len(users))]
+        sessions[feature].append((user, f'DESKTOP-{user.upper()}', handle,
+                                  f'Mon 7/{rng.randint(1, 28)} {rng.randint(0, 23)}:{rng.randint(0, 59):02d}'))
+        handle += 100
+
+    features = {}
+    for name in names:
+        in_use = len(sessions[name])
+        features[name] = (max(in_use, rng.choice((2, 4, 8, 16))), sessions[name])
+    return build_dump(preamble, features)
+
+
+def format_start(timestamp):
+    """lmstat's checkout start, e.g. 'Mon 7/7 9:47'"""
+    return f'{timestamp:%a} {timestamp.month}/{timestamp.day} {timestamp.hour}:{timestamp.minute:02d}'
+
+
+def simulate_history(start, captures, interval, num_features, num_users, peak_sessions,
+                     mean_session_minutes=90, seed=0, path=TEMPLATE_FILE):
+    """Yield (timestamp, capture) for captures taken every interval from start
+
+    Users check features out and back in: demand follows office hours on
+    weekdays with a low floor at night and at weekends, popular features
+    draw most checkouts, sessions last mean_session_minutes on average and
+    a checkout of a feature already fully in use is denied. Consecutive
+    captures therefore share most of their checkouts, like real ones.
+    """
+    rng = random.Random(seed)
+    preamble, template_features = load_template(path)
+    names = feature_names(template_features, num_features)
+    totals = {name: rng.choice((2, 4, 8, 16, 32)) for name in names}
+    # Zipf-like popularity: a few features take most of the load
+    weights = [1 / (rank + 1) for rank in range(num_features)]
+    users = [f'user{i:04d}' for i in range(num_users)]
+    sessions = {name: [] for name in names}
+    handle = 8801
+    close_rate = min(1.0, interval.total_seconds() / 60 / mean_session_minutes)
+
+    for step in range(captures):
+        timestamp = start + interval * step
+        busy = timestamp.weekday() < 5 and 8 <= timestamp.hour < 18
+        target = peak_sessions * (rng.uniform(0.8, 1.0) if busy else rng.uniform(0.02, 0.1))
+
+        for name in names:
+            if sessions[name]:
+                sessions[name] = [s for s in sessions[name] if rng.random() >= close_rate]
+        active = sum(len(s) for s in sessions.values())
+        # Arrivals replace the closed checkouts and move towards the target
+        arrivals = max(0, round(target * close_rate + (target - active) * 0.1 + rng.gauss(0, 1)))
+        for name in rng.choices(names, weights, k=arrivals):
+            if len(sessions[name]) >= totals[name]:
+                continue  # denied: every license of the feature is in use
+            user = rng.choice(users)
+            sessions[name].append((user, f'DESKTOP-{user.upper()}', handle, format_start(timestamp)))
+            handle += 100
+
+        yield timestamp, build_dump(preamble, {name: (totals[name], sessions[name]) for name in names})
@@ -0,0 +1,161 @@
+"""Asynchronous lmstat collector for one or more FlexLM license servers
+
+All servers are polled concurrently on a dedicated event loop thread, each
+with its own timeout and retries with exponential backoff and jitter. Callers
+on any thread trigger a run with AsyncCollector.run(); a trigger that arrives
+while a run is in flight joins that run instead of starting another.
+"""
+import asyncio
+import locale
+import os
+import random
+import signal
+import subprocess
+import threading
+import time
+
+from metrics import LATENCY_BUCKETS, Counter, Histogram
+
+LMSTAT_SECONDS = Histogram('licstats_lmstat_duration_seconds',
+                           'Wall time of one lmstat attempt per server, by outcome (ok, error, timeout)',
+                           labels=('server', 'outcome'), buckets=LATENCY_BUCKETS + (120, 300))
+LMSTAT_BYTES = Counter('licstats_lmstat_output_bytes_total', 'Bytes of lmstat output received per server',
+                       labels=('server',))
+COLLECTION_SECONDS = Histogram('licstats_collection_duration_seconds',
+                               'Wall time of polling every server in one collection run, retries included',
+                               buckets=LATENCY_BUCKETS + (120, 300))
+
+
+class CollectError(Exception):
+    pass
+
+
+class CollectTimeout(CollectError):
+    pass
+
+
+class AsyncCollector:
+    """Concurrent lmstat polling with per-server timeout, backoff and run deduplication"""
+
+    def __init__(self, servers, command, timeout=60, retries=2, backoff=2.0,
+                 max_backoff=30.0, jitter=0.5, debug_file=None):
+        self.servers = list(servers)
+        self.command = command  # formatted with {server}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.debug_file = debug_file
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._inflight = None
+        self._inflight_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name='lmstat-collector', daemon=True)
+                thread.start()
+            return self._loop
+
+    def run(self, handle_results):
+        """Start a collection run, or join the one in flight
+
+        handle_results(results) is called on a worker thread with a list of
+        (server, output) pairs, where output is an Exception for servers that
+        failed every attempt. Returns a concurrent.futures.Future of its result.
+        """
+        with self._inflight_lock:
+            if self._inflight is not None and not self._inflight.done():
+                return self._inflight
+            loop = self._ensure_loop()
+            self._inflight = asyncio.run_coroutine_threadsafe(self._run(handle_results), loop)
+            return self._inflight
+
+    @property
+    def in_flight(self):
+        future = self._inflight
+        return future is not None and not future.done()
+
+    async def _run(self, handle_results):
+        with COLLECTION_SECONDS.time():
+            results = await self.fetch_all()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, handle_results, results)
+
+    async def fetch_all(self):
+        """Poll every server concurrently; never raises"""
+        outputs = await asyncio.gather(*(self.fetch_server(server) for server in self.servers),
+                                       return_exceptions=True)
+        return list(zip(self.servers, outputs))
+
+    async def fetch_server(self, server):
+        """Return one server's lmstat output, retrying with backoff on failure"""
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                output = await self._fetch_once(server)
+            except (CollectError, OSError) as e:
+                outcome = 'timeout' if isinstance(e, CollectTimeout) else 'error'
+                LMSTAT_SECONDS.observe(time.perf_counter() - started, server=server, outcome=outcome)
+                if attempt >= self.retries:
+                    raise CollectError(f"{server}: {e} (after {attempt + 1} attempts)") from e
+                await asyncio.sleep(self._backoff_delay(attempt))
+                attempt += 1
+            else:
+                LMSTAT_SECONDS.observe(time.perf_counter() - started, server=server, outcome='ok')
+                return output
+
+    def _backoff_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def _fetch_once(self, server):
+        if self.debug_file:
+            loop = asyncio.get_running_loop()
+            content = await loop.run_in_executor(None, _read_text, self.debug_file)
+            LMSTAT_BYTES.inc(len(content.encode('utf-8')), server=server)
+            return content
+
+        process = await asyncio.create_subprocess_shell(
+            self.command.format(server=server),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Own process group, so a timeout kills lmstat and not just the shell
+            start_new_session=os.name != 'nt')
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            await _kill_tree(process)
+            raise CollectTimeout(f"timed out after {self.timeout}s")
+
+        LMSTAT_BYTES.inc(len(stdout), server=server)
+        encoding = locale.getpreferredencoding(False)
+        if process.returncode != 0:
+            raise CollectError(f"Command failed: {stderr.decode(encoding, errors='replace').strip()}")
+        return stdout.decode(encoding, errors='replace')
+
+
+async def _kill_tree(process):
+    """Kill a shell subprocess together with the command it started"""
+    try:
+        if os.name == 'nt':
+            killer = await asyncio.create_subprocess_exec(
+                'taskkill', '/F', '/T', '/PID', str(process.pid),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            await killer.wait()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        if process.returncode is None:
+            process.kill()
+    await process.wait()
+
+
+def _read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
@@ -0,0 +1,176 @@
+"""Compact in-memory snapshots for holding a retention window of captures
+
+A parsed snapshot (see diff.py) is a list of row tuples of Python strings and
+ints, and parse_license_data's form wraps each row in a dict on top. Most of
+those strings repeat from one capture to the next: feature, user and host
+names, connection handles, start times and even the raw detail line of a
+checkout that stays open. A CompactSnapshot interns every string through a
+SymbolTable shared by the whole window and keeps only integer ids and counts
+in array('i') columns, so a snapshot costs a few machine words per row and
+the strings are held once per window instead of once per capture.
+"""
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from threading import Lock
+
+from diff import state_licenses
+
+# Integer columns per user row: feature, user, host, connection, start_time,
+# linger and details symbols, in diff.py's row order
+USER_COLUMNS = 7
+# prune() re-interns the window once the symbol table has grown this much
+# since it was last rebuilt, dropping the strings of pruned snapshots
+SYMBOL_REBUILD_GROWTH = 2
+MIN_SYMBOL_REBUILD = 4096
+
+
+class SymbolTable:
+    """Two-way map between strings and dense integer ids"""
+
+    def __init__(self):
+        self._ids = {}
+        self._symbols = []
+        self._lock = Lock()
+
+    def intern(self, symbol):
+        symbol_id = self._ids.get(symbol)
+        if symbol_id is None:
+            with self._lock:
+                symbol_id = self._ids.get(symbol)
+                if symbol_id is None:
+                    symbol_id = len(self._symbols)
+                    self._symbols.append(symbol)
+                    self._ids[symbol] = symbol_id
+        return symbol_id
+
+    @property
+    def lookup(self):
+        """Function from id to string, for map()"""
+        return self._symbols.__getitem__
+
+    def __getitem__(self, symbol_id):
+        return self._symbols[symbol_id]
+
+    def __len__(self):
+        return len(self._symbols)
+
+
+class CompactSnapshot:
+    """One capture as interned integer columns
+
+    features, totals and in_use hold one entry per feature row; users holds
+    USER_COLUMNS symbol ids per user row, flattened.
+    """
+    __slots__ = ('id', 'timestamp', 'features', 'totals', 'in_use', 'users')
+
+    def __init__(self, snapshot_id, timestamp, features, totals, in_use, users):
+        self.id = snapshot_id
+        self.timestamp = timestamp
+        self.features = features
+        self.totals = totals
+        self.in_use = in_use
+        self.users = users
+
+    @classmethod
+    def from_state(cls, symbols, snapshot_id, timestamp, state):
+        feature_rows, user_rows = state
+        intern = symbols.intern
+        features, totals, in_use = array('i'), array('i'), array('i')
+        for feature, total, used in feature_rows:
+            features.append(intern(feature))
+            totals.append(total)
+            in_use.append(used)
+        users = array('i', [intern(value) for row in user_rows for value in row])
+        return cls(snapshot_id, timestamp, features, totals, in_use, users)
+
+    def state(self, symbols):
+        """The (features, users) row lists this snapshot was built from"""
+        lookup = symbols.lookup
+        features = list(zip(map(lookup, self.features), self.totals, self.in_use))
+        # zip over one iterator repeated USER_COLUMNS times groups the flat ids into rows
+        users = list(zip(*[map(lookup, self.users)] * USER_COLUMNS))
+        return features, users
+
+    def licenses(self, symbols):
+        """Rebuild the parse_license_data structure"""
+        return state_licenses(self.state(symbols))
+
+    def nbytes(self):
+        """Bytes held by the columns (the shared symbols excluded)"""
+        return sum(column.itemsize * len(column)
+                   for column in (self.features, self.totals, self.in_use, self.users))
+
+
+class SnapshotWindow:
+    """Compact snapshots of the last `hours` hours, ordered by capture time
+
+    start is the earliest capture time the window is complete from: every
+    snapshot at or after it that was added is held, so a query whose range
+    begins at or after start can be answered from memory alone.
+    """
+
+    def __init__(self, hours):
+        self.hours = hours
+        self.symbols = SymbolTable()
+        self.start = datetime.now() - timedelta(hours=hours)
+        self.last_id = 0  # highest snapshot id added
+        self._rebuilt_symbols = 0  # table size after the last rebuild
+        self._keys = []  # (timestamp, id), ascending
+        self._snapshots = {}  # id -> CompactSnapshot
+        self._lock = Lock()
+
+    def add(self, snapshot_id, timestamp, state):
+        """Hold one snapshot's state; snapshots older than the window are dropped"""
+        with self._lock:
+            self.last_id = max(self.last_id, snapshot_id)
+            if snapshot_id in self._snapshots or timestamp < self.start:
+                return
+            self._snapshots[snapshot_id] = CompactSnapshot.from_state(self.symbols, snapshot_id, timestamp, state)
+            insort(self._keys, (timestamp, snapshot_id))
+
+    def prune(self, now=None):
+        """Move start to `hours` before now and drop the snapshots before it"""
+        start = (now or datetime.now()) - timedelta(hours=self.hours)
+        with self._lock:
+            if start <= self.start:
+                return
+            self.start = start
+            cut = bisect_left(self._keys, (start,))
+            for _, snapshot_id in self._keys[:cut]:
+                del self._snapshots[snapshot_id]
+            del self._keys[:cut]
+            if len(self.symbols) > max(MIN_SYMBOL_REBUILD, SYMBOL_REBUILD_GROWTH * self._rebuilt_symbols):
+                self._rebuild_symbols()
+
+    def _rebuild_symbols(self):
+        """Re-intern every held snapshot into a fresh table (lock held)
+
+        Snapshots are replaced rather than modified, so a replay() already
+        holding the old table and snapshots stays consistent.
+        """
+        symbols = SymbolTable()
+        for snapshot_id, snapshot in self._snapshots.items():
+            self._snapshots[snapshot_id] = CompactSnapshot.from_state(
+                symbols, snapshot_id, snapshot.timestamp, snapshot.state(self.symbols))
+        self.symbols = symbols
+        self._rebuilt_symbols = len(symbols)
+
+    def covers(self, start):
+        return start is not None and start >= self.start
+
+    def replay(self, start=None, end=None):
+        """Yield (snapshot id, timestamp, licenses) for snapshots in [start, end), oldest first"""
+        with self._lock:
+            symbols = self.symbols
+            lo = bisect_left(self._keys, (start,)) if start is not None else 0
+            hi = bisect_left(self._keys, (end,)) if end is not None else len(self._keys)
+            snapshots = [self._snapshots[snapshot_id] for _, snapshot_id in self._keys[lo:hi]]
+        for snapshot in snapshots:
+            yield snapshot.id, snapshot.timestamp, snapshot.licenses(symbols)
+
+    def nbytes(self):
+        return sum(snapshot.nbytes() for snapshot in self._snapshots.values())
+
+    def __len__(self):
+        return len(self._snapshots)
@@ -0,0 +1,177 @@
+"""Structured diffs between parsed lmstat snapshots
+
+A snapshot's state is two ordered row lists: features as (feature, total,
+in_use) and user records as (feature, user, host, connection, start_time,
+linger, details). A delta turns one state into another with slice
+replacements [start, end, rows] per list, applied back to front. Consecutive
+captures differ in a handful of rows, so a delta is a tiny fraction of the
+state it replaces; the store keeps them between periodic full keyframes.
+"""
+from difflib import SequenceMatcher
+
+# Same-length lists with at most this share of rows changed are diffed row by
+# row; anything else (insertions shifting the tail) goes through SequenceMatcher
+INPLACE_CHANGE_RATIO = 0.25
+
+
+def snapshot_state(licenses):
+    """(features, users) row lists of a parse_license_data result"""
+    features = [(l['feature'], l['total'], l['in_use']) for l in licenses]
+    users = [(l['feature'], u['user'], u['host'], u['connection'], u['start_time'], u['linger'], u['details'])
+             for l in licenses for u in l['users']]
+    return features, users
+
+
+def state_licenses(state):
+    """Rebuild the parse_license_data structure from a state"""
+    features, users = state
+    licenses = []
+    by_feature = {}
+    for feature, total, in_use in features:
+        license_data = {
+            'feature': feature,
+            'total': total,
+            'in_use': in_use,
+            'available': total - in_use,
+            'users': []
+        }
+        licenses.append(license_data)
+        by_feature.setdefault(feature, license_data)
+
+    for feature, user, host, connection, start_time, linger, details in users:
+        license_data = by_feature.get(feature)
+        if license_data is not None:
+            license_data['users'].append({
+                'user': user,
+                'host': host,
+                'connection': connection,
+                'start_time': start_time,
+                'linger': linger,
+                'details': details
+            })
+    return licenses
+
+
+def keyframe(state):
+    """JSON-ready full state"""
+    features, users = state
+    return {'f': features, 'u': users}
+
+
+def keyframe_state(frame):
+    return [tuple(row) for row in frame['f']], [tuple(row) for row in frame['u']]
+
+
+def encode_delta(base, state):
+    """JSON-ready delta turning base into state; {} when they are equal"""
+    delta = {}
+    feature_ops = _list_ops(base[0], state[0])
+    if feature_ops:
+        delta['f'] = feature_ops
+    user_ops = _list_ops(base[1], state[1])
+    if user_ops:
+        delta['u'] = user_ops
+    return delta
+
+
+def apply_delta(base, delta):
+    """State produced by applying a delta (as decoded from JSON) to base"""
+    features = _apply_ops(base[0], delta.get('f'))
+    users = _apply_ops(base[1], delta.get('u'))
+    return features, users
+
+
+def _list_ops(old, new):
+    if old == new:
+        return []
+    if len(old) == len(new):
+        changed = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+        if len(changed) <= max(1, len(new) * INPLACE_CHANGE_RATIO):
+            return [[i, i + 1, [new[i]]] for i in changed]
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    return [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def _apply_ops(rows, ops):
+    if not ops:
+        return rows
+    rows = list(rows)
+    # Ops are ascending and refer to the base's indexes, so apply from the end
+    for start, end, replacement in reversed(ops):
+        rows[start:end] = [tuple(row) for row in replacement]
+    return rows
+
+
+def diff_states(before, after):
+    """What changed between two snapshot states
+
+    features lists every feature whose total or in_use differs, with status
+    'changed', 'added' or 'removed'; sessions_added/sessions_removed are the
+    checkouts (feature, user, host, connection, start time) present in only
+    one of the two snapshots.
+    """
+    old_features = {}
+    for feature, total, in_use in before[0]:
+        old_features.setdefault(feature, (total, in_use))
+    new_features = {}
+    for feature, total, in_use in after[0]:
+        new_features.setdefault(feature, (total, in_use))
+
+    features = []
+    for feature, (total, in_use) in new_features.items():
+        old = old_features.get(feature)
+        if old == (total, in_use):
+            continue
+        features.append(_feature_change(feature, 'added' if old is None else 'changed', old or (0, 0),
+                                        (total, in_use)))
+    for feature, old in old_features.items():
+        if feature not in new_features:
+            features.append(_feature_change(feature, 'removed', old, (0, 0)))
+
+    old_sessions = {row[:5] for row in before[1]}
+    new_sessions = {row[:5] for row in after[1]}
+    return {
+        'features': features,
+        'sessions_added': [_session(row) for row in _ordered(after[1], new_sessions - old_sessions)],
+        'sessions_removed': [_session(row) for row in _ordered(before[1], old_sessions - new_sessions)]
+    }
+
+
+def diff_licenses(before, after):
+    """diff_states over two parse_license_data results"""
+    return diff_states(snapshot_state(before), snapshot_state(after))
+
+
+def _feature_change(feature, status, old, new):
+    return {
+        'feature': feature,
+        'status': status,
+        'total': new[0],
+        'in_use': new[1],
+        'available': new[0] - new[1],
+        'total_before': old[0],
+        'in_use_before': old[1]
+    }
+
+
+def _ordered(rows, keys):
+    """Session keys in the order their rows appear in the snapshot, deduplicated"""
+    ordered = []
+    seen = set()
+    for row in rows:
+        key = row[:5]
+        if key in keys and key not in seen:
+            seen.add(key)
+            ordered.append(key)
+    return ordered
+
+
+def _session(key):
+    feature, user, host, connection, start_time = key
+    return {
+        'feature': feature,
+        'user': user,
+        'host': host,
+        'connection': connection,
+        'start_time': start_time
+    }
@@ -0,0 +1,154 @@
+"""Server-sent event fan-out of collection updates
+
+Each published message is serialized once and queued to every connected
+client. The most recent messages are kept, so an EventSource that reconnects
+with Last-Event-ID receives what it missed; one that fell further behind gets
+a 'reset' event and reloads its data instead.
+"""
+import json
+import queue
+import threading
+from collections import deque
+
+HEARTBEAT_SECONDS = 15  # comment line sent on idle streams so proxies keep them open
+RETRY_MILLISECONDS = 5000  # EventSource reconnect delay
+DISCONNECT_POLL_SECONDS = 1  # how often an idle stream asks the server whether its client left
+
+
+def format_event(event, data, event_id=None):
+    """Render one SSE message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, separators=(',', ':'), ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventBroadcaster:
+    """Publish/subscribe hub for SSE clients, one bounded queue per client
+
+    Every open stream holds a server thread, so at most max_clients streams
+    are served at once (None: no limit); subscribe() refuses further ones.
+    """
+
+    def __init__(self, history=100, client_queue_size=100, max_clients=None):
+        self.client_queue_size = client_queue_size
+        self.max_clients = max_clients
+        self._streams = 0  # subscriptions not yet closed, dropped clients included
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._dropped = set()
+        self._history = deque(maxlen=history)  # (event id, message)
+        self._next_id = 1
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def publish(self, event, data):
+        """Send an event to every connected client; returns its id"""
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            message = format_event(event, data, event_id)
+            self._history.append((event_id, message))
+            clients = list(self._clients)
+
+        for client in clients:
+            try:
+                client.put_nowait(message)
+            except queue.Full:
+                # Too far behind to catch up from the queue: the client is
+                # closed and resyncs from history (or a reset) on reconnect
+                with self._lock:
+                    self._clients.discard(client)
+                    self._dropped.add(client)
+        return event_id
+
+    def _backlog(self, last_event_id):
+        """Messages a reconnecting client missed, or a reset if history no longer covers them"""
+        if last_event_id is None:
+            return []
+        if self._history and last_event_id + 1 < self._history[0][0]:
+            return [format_event('reset', {})]
+        if last_event_id >= self._next_id:
+            # Ids from before a server restart
+            return [format_event('reset', {})]
+        return [message for event_id, message in self._history if event_id > last_event_id]
+
+    def subscribe(self, last_event_id=None, disconnected=None):
+        """The SSE stream of one new client, or None when max_clients streams are open
+
+        disconnected is the server's check for a closed client connection
+        (waitress.client_disconnected), which frees the stream's thread
+        without waiting for a write to fail.
+        """
+        client = queue.Queue(self.client_queue_size)
+        with self._lock:
+            if self.max_clients is not None and self._streams >= self.max_clients:
+                return None
+            self._streams += 1
+            backlog = self._backlog(last_event_id)
+            self._clients.add(client)
+        return _Stream(self, client, backlog, disconnected)
+
+    def _stream(self, client, backlog, disconnected):
+        """Yield one client's messages until it disconnects or is dropped"""
+        poll = DISCONNECT_POLL_SECONDS if disconnected else HEARTBEAT_SECONDS
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        for message in backlog:
+            yield message
+        idle = 0
+        while True:
+            try:
+                message = client.get(timeout=poll)
+            except queue.Empty:
+                if client in self._dropped or (disconnected and disconnected()):
+                    return
+                idle += poll
+                if idle >= HEARTBEAT_SECONDS:
+                    idle = 0
+                    yield ": keepalive\n\n"
+                continue
+            idle = 0
+            yield message
+            if client in self._dropped and client.empty():
+                return
+
+    def _release(self, client):
+        with self._lock:
+            self._clients.discard(client)
+            self._dropped.discard(client)
+            self._streams -= 1
+
+
+class _Stream:
+    """Iterable SSE response releasing its slot on close()
+
+    The WSGI server closes the response even when the client went away
+    before the first message, where a generator's own cleanup would not run.
+    """
+
+    def __init__(self, broadcaster, client, backlog, disconnected=None):
+        self._broadcaster = broadcaster
+        self._client = client
+        self._messages = broadcaster._stream(client, backlog, disconnected)
+        self._closed = False
+
+    def __iter__(self):
+        return self._messages
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._messages.close()
+            self._broadcaster._release(self._client)
+
+
+def parse_event_id(value):
+    """Last-Event-ID header value as an int, or None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
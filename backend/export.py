@@ -0,0 +1,197 @@
+"""Bulk export of usage history as CSV or Parquet for BI tools
+
+Two datasets, read from the snapshot store the parser fills at collection
+time rather than re-parsing raw captures:
+
+    usage     one row per feature per snapshot: timestamp, feature, total,
+              in_use, available and the number of distinct users
+    sessions  one row per reconstructed checkout session overlapping the
+              range, its duration clipped to the range like /api/sessions
+
+Rows are written in row groups of at most ROW_GROUP_SIZE rows, each encoded
+and handed on before the next is read, so exporting a year holds one group
+in memory. Parquet needs pyarrow (pip install pyarrow); CSV has no extra
+dependencies.
+
+Usage (from backend/):
+    python export.py usage --from 2025-01-01 --to 2026-01-01 -o usage.csv
+    python export.py sessions --format parquet -o sessions.parquet
+"""
+import argparse
+import csv
+import io
+import sys
+from datetime import datetime
+from itertools import islice
+
+from sessions import SessionTracker
+from store import SnapshotStore
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ROW_GROUP_SIZE = 50000
+FORMATS = ('csv', 'parquet')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'parquet': 'application/vnd.apache.parquet'}
+
+# (column, type) per dataset; types are 'timestamp', 'string', 'int' or 'float'
+COLUMNS = {
+    'usage': (('timestamp', 'timestamp'), ('feature', 'string'), ('total', 'int'),
+              ('in_use', 'int'), ('available', 'int'), ('users', 'int')),
+    'sessions': (('feature', 'string'), ('user', 'string'), ('host', 'string'), ('connection', 'string'),
+                 ('started_at', 'timestamp'), ('ended_at', 'timestamp'), ('last_seen', 'timestamp'),
+                 ('duration_minutes', 'float'))
+}
+DATASETS = tuple(COLUMNS)
+
+
+def usage_rows(store, start=None, end=None):
+    """Yield one usage row per feature of every snapshot in [start, end)"""
+    for _, timestamp, licenses in store.replay(start, end):
+        for l in licenses:
+            yield (timestamp, l['feature'], l['total'], l['in_use'], l['available'],
+                   len({u['user'] for u in l['users']}))
+
+
+def session_rows(store, start=None, end=None):
+    """Yield one row per checkout session overlapping [start, end)"""
+    for s in SessionTracker(store, auto_rebuild=False).iter_sessions(start, end):
+        yield (s['feature'], s['user'], s['host'], s['connection'],
+               datetime.fromisoformat(s['started_at']),
+               datetime.fromisoformat(s['ended_at']) if s['ended_at'] else None,
+               datetime.fromisoformat(s['last_seen']), s['duration_minutes'])
+
+
+def dataset_rows(store, dataset, start=None, end=None):
+    if dataset == 'usage':
+        return usage_rows(store, start, end)
+    return session_rows(store, start, end)
+
+
+def row_groups(rows, size=ROW_GROUP_SIZE):
+    """Split a row iterator into lists of at most size rows"""
+    rows = iter(rows)
+    while True:
+        group = list(islice(rows, size))
+        if not group:
+            return
+        yield group
+
+
+def encode_csv(dataset, groups):
+    """Yield a header line, then the CSV text of each row group"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([name for name, _ in COLUMNS[dataset]])
+    for group in groups:
+        writer.writerows((_csv_value(value) for value in row) for row in group)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # No rows: the header alone
+        yield buffer.getvalue()
+
+
+def encode_parquet(dataset, groups):
+    """Yield the bytes of a zstd-compressed Parquet file, one row group at a time"""
+    types = {'timestamp': pyarrow.timestamp('us'), 'string': pyarrow.string(),
+             'int': pyarrow.int64(), 'float': pyarrow.float64()}
+    schema = pyarrow.schema([(name, types[kind]) for name, kind in COLUMNS[dataset]])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for group in groups:
+            columns = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*group), schema)]
+            writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export(store, dataset, fmt, start=None, end=None, row_group_size=ROW_GROUP_SIZE):
+    """Yield the encoded chunks (str for CSV, bytes for Parquet) of a dataset over [start, end)"""
+    if dataset not in COLUMNS:
+        raise ValueError(f"Unknown dataset {dataset!r}, expected one of {', '.join(DATASETS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    if fmt == 'parquet' and pyarrow is None:
+        raise RuntimeError('Parquet export needs pyarrow: pip install pyarrow')
+    groups = row_groups(dataset_rows(store, dataset, start, end), row_group_size)
+    if fmt == 'csv':
+        return encode_csv(dataset, groups)
+    return encode_parquet(dataset, groups)
+
+
+class _ChunkSink:
+    """Write-only file object collecting what ParquetWriter writes until drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return '' if value is None else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dataset', choices=DATASETS)
+    parser.add_argument('--format', choices=FORMATS, default=None, help='default: from the --output extension, else csv')
+    parser.add_argument('--from', dest='start', type=datetime.fromisoformat, default=None, help='ISO timestamp')
+    parser.add_argument('--to', dest='end', type=datetime.fromisoformat, default=None, help='ISO timestamp, exclusive')
+    parser.add_argument('--store', default='licstats.db')
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE)
+    parser.add_argument('-o', '--output', default=None, help='default: stdout (CSV only)')
+    args = parser.parse_args()
+
+    fmt = args.format or ('parquet' if args.output and args.output.endswith('.parquet') else 'csv')
+    if fmt == 'parquet' and args.output is None:
+        parser.error('Parquet output needs --output')
+    try:
+        chunks = export(SnapshotStore(args.store, migrate=False), args.dataset, fmt,
+                        args.start, args.end, args.row_group_size)
+        if args.output is None:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        if fmt == 'csv':
+            output = open(args.output, 'w', encoding='utf-8', newline='')
+        else:
+            output = open(args.output, 'wb')
+        with output as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import re
+
+# Every line that opens a feature block, found in one pass over the buffer.
+# [^\S\n] is "whitespace except newline" so a match never spans two lines.
+FEATURE_LINE_RE = re.compile(r'^[^\S\n]*Users of[^\n]*', re.MULTILINE)
+
+FEATURE_RE = re.compile(
+    r'Users of ([^:]+):\s+\(Total of (\d+) licenses issued;\s+Total of (\d+) licenses? in use\)')
+
+# Pattern: username hostname details (HQCNDB/29000 port), start date time (linger: number)
+USER_RE = re.compile(r'(\w+)\s+([^\s]+)\s+.*?\(([^)]+)\),\s*start\s+(.+?)\s*\(linger:\s*(\d+)\)')
+
+
+def parse_license_data(content):
+    """Parse license usage data from lmstat output
+
+    Feature header lines are located with a single multiline regex scan, and
+    only the blocks of features with licenses in use are split into lines and
+    matched for user details, so idle features cost no per-line Python work.
+    A feature listed more than once (output of several license servers
+    concatenated) is reported once with its counts and users combined.
+    """
+    licenses = []
+    by_feature = {}
+    headers = list(FEATURE_LINE_RE.finditer(content))
+
+    for index, header in enumerate(headers):
+        feature_match = FEATURE_RE.match(header.group().strip())
+        if not feature_match:
+            continue
+
+        feature = feature_match.group(1)
+        total_licenses = int(feature_match.group(2))
+        licenses_in_use = int(feature_match.group(3))
+        license_data = by_feature.get(feature)
+        if license_data is None:
+            license_data = by_feature[feature] = {
+                'feature': feature,
+                'total': total_licenses,
+                'in_use': licenses_in_use,
+                'available': total_licenses - licenses_in_use,
+                'users': []
+            }
+            licenses.append(license_data)
+        else:
+            license_data['total'] += total_licenses
+            license_data['in_use'] += licenses_in_use
+            license_data['available'] = license_data['total'] - license_data['in_use']
+        users = license_data['users']
+
+        if licenses_in_use <= 0:
+            continue
+
+        # User lines sit between this header and the next "Users of" line
+        block_end = headers[index + 1].start() if index + 1 < len(headers) else len(content)
+        for detail_line in content[header.end():block_end].split('\n'):
+            if 'linger:' not in detail_line:
+                continue
+            detail_line = detail_line.strip()
+            user_match = USER_RE.match(detail_line)
+            if user_match:
+                users.append({
+                    'user': user_match.group(1),
+                    'host': user_match.group(2),
+                    'connection': user_match.group(3),
+                    'start_time': user_match.group(4),
+                    'linger': user_match.group(5),
+                    'details': detail_line
+                })
+
+    return licenses
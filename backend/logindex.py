@@ -0,0 +1,172 @@
+"""Persisted index of the plain .txt captures in the logs directory
+
+get_log_files used to list and stat every file on each request. The index
+keeps each capture's timestamp and size in the store's log_files table, is
+loaded once at startup and is updated as captures are written. reconcile()
+lists the directory to pick up files added or removed behind the app's back
+and stats only the new ones; at startup, loading and reconciling cost about
+as much as listing and stat'ing the directory, the saving is per request. Entries also carry the id of the capture's
+parsed snapshot, so its licenses can be loaded from the store instead of
+re-parsed.
+
+The timestamp is the capture time encoded in the filename (mtime for files
+named otherwise), and entries are kept sorted by it, so the latest capture
+and the captures of a time range are found by bisection.
+"""
+import os
+from bisect import bisect_left, insort
+from datetime import datetime
+from threading import Lock
+
+from archive import CAPTURE_FORMAT
+
+# Changed whenever entries are removed, telling other processes to reload
+GENERATION_KEY = 'log_index_generation'
+
+
+class LogIndex:
+    def __init__(self, store, directory):
+        self.store = store
+        self.directory = directory
+        self._entries = {}  # filename -> {'filename', 'filepath', 'timestamp', 'size'}
+        self._snapshot_ids = {}  # filename -> snapshot id
+        self._order = []  # (timestamp datetime, filename), ascending
+        self._lock = Lock()
+        self._last_rowid = 0
+        self._generation = None
+        self.load()
+
+    def load(self):
+        """Load the whole index from the store"""
+        with self._lock:
+            self._entries = {}
+            self._snapshot_ids = {}
+            self._order = []
+            self._last_rowid = 0
+            self._generation = self.store.get_meta(GENERATION_KEY)
+        self.refresh()
+
+    def refresh(self):
+        """Pick up entries another process wrote since the last load or refresh"""
+        if self.store.get_meta(GENERATION_KEY) != self._generation:
+            self.load()
+            return
+        rows = self.store.execute(
+            'SELECT l.rowid, l.filename, l.timestamp, l.size, s.id AS snapshot_id FROM log_files l '
+            'LEFT JOIN snapshots s ON s.filename = l.filename WHERE l.rowid > ? ORDER BY l.rowid',
+            (self._last_rowid,)).fetchall()
+        with self._lock:
+            for row in rows:
+                self._put(self._entry(row['filename'], row['timestamp'], row['size']))
+                if row['snapshot_id'] is not None:
+                    self._snapshot_ids[row['filename']] = row['snapshot_id']
+                self._last_rowid = row['rowid']
+
+    def add(self, filename, snapshot_id=None):
+        """Index a capture just written to the directory"""
+        entry = self._stat(filename)
+        with self.store.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO log_files (filename, timestamp, size) VALUES (?, ?, ?)',
+                         (filename, entry['timestamp'], entry['size']))
+        with self._lock:
+            self._put(entry)
+            if snapshot_id is not None:
+                self._snapshot_ids[filename] = snapshot_id
+
+    def set_snapshot(self, filename, snapshot_id):
+        with self._lock:
+            self._snapshot_ids[filename] = snapshot_id
+
+    def reconcile(self):
+        """Match the index to the directory; returns (files added, files removed)"""
+        names = {f for f in os.listdir(self.directory) if f.endswith('.txt')}
+        with self._lock:
+            known = set(self._entries)
+        added = []
+        for filename in names - known:
+            try:
+                added.append(self._stat(filename))
+            except FileNotFoundError:
+                # Deleted or archived since the listing
+                continue
+        removed = sorted(known - names)
+        if not added and not removed:
+            return 0, 0
+
+        with self.store.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO log_files (filename, timestamp, size) VALUES (?, ?, ?)',
+                             [(e['filename'], e['timestamp'], e['size']) for e in added])
+            conn.executemany('DELETE FROM log_files WHERE filename = ?', [(f,) for f in removed])
+            if removed:
+                conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                             'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                             (GENERATION_KEY, datetime.now().isoformat()))
+        with self._lock:
+            for entry in added:
+                self._put(entry)
+            for filename in removed:
+                self._drop(filename)
+                self._snapshot_ids.pop(filename, None)
+            if removed:
+                self._generation = self.store.get_meta(GENERATION_KEY)
+        return len(added), len(removed)
+
+    def entries(self):
+        """Every indexed capture, oldest first; the dicts are shared and must not be modified"""
+        return self.between()
+
+    def between(self, start=None, end=None):
+        """Captures with start <= timestamp < end (either bound may be None), oldest first"""
+        with self._lock:
+            lo = bisect_left(self._order, (start,)) if start is not None else 0
+            hi = bisect_left(self._order, (end,)) if end is not None else len(self._order)
+            return [self._entries[filename] for _, filename in self._order[lo:hi]]
+
+    def latest(self):
+        """The newest capture, or None when the index is empty"""
+        with self._lock:
+            if not self._order:
+                return None
+            return self._entries[self._order[-1][1]]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def filenames(self):
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, filename):
+        return self._entries.get(filename)
+
+    def snapshot_id(self, filename):
+        return self._snapshot_ids.get(filename)
+
+    def _put(self, entry):
+        self._drop(entry['filename'])
+        self._entries[entry['filename']] = entry
+        # Captures are usually indexed in time order, so this appends
+        insort(self._order, (datetime.fromisoformat(entry['timestamp']), entry['filename']))
+
+    def _drop(self, filename):
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            key = (datetime.fromisoformat(entry['timestamp']), filename)
+            del self._order[bisect_left(self._order, key)]
+
+    def _stat(self, filename):
+        filepath = os.path.join(self.directory, filename)
+        stat = os.stat(filepath)
+        try:
+            timestamp = datetime.strptime(filename, CAPTURE_FORMAT)
+        except ValueError:
+            timestamp = datetime.fromtimestamp(stat.st_mtime)
+        return self._entry(filename, timestamp.isoformat(), stat.st_size)
+
+    def _entry(self, filename, timestamp, size):
+        return {
+            'filename': filename,
+            'filepath': os.path.join(self.directory, filename),
+            'timestamp': timestamp,
+            'size': size
+        }
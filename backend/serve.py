@@ -0,0 +1,138 @@
+"""Production server: one collector process plus a multi-threaded / multi-process API
+
+app.py run directly collects and serves in one process on Flask's dev server.
+Here the collector (scheduler, lmstat runs, sync and archive jobs) runs in a
+process of its own and the API is served by a WSGI server whose workers only
+read the SQLite store the collector writes, so they never start collectors
+or write log files of their own. /api/collect in a worker asks the collector
+through the store.
+
+The WSGI server is gunicorn with threaded workers where it is installed (not
+on Windows), otherwise waitress: one process with a thread pool. An open
+/api/events stream holds a thread for as long as the dashboard stays
+connected, so each process serves at most --sse-clients streams (more get
+503) and its pool has that many threads on top of --threads, which are left
+for the other requests.
+
+/api/metrics shows the metrics of the web process that answered, so with
+several gunicorn workers on one port successive scrapes disagree; scrape
+single-worker web processes on ports of their own instead. The collector's
+metrics (lmstat runs, collections, parsing) are served on --metrics-port at
+/metrics.
+
+Usage (from backend/):
+    python serve.py                              collector + API on port 5000
+    python serve.py --workers 4 --threads 8 --port 8000
+    python serve.py --server waitress --threads 16 --sse-clients 32
+    python serve.py collector                    collector only, its metrics on port 9108
+    python serve.py web                          API only, with a collector running elsewhere
+"""
+import argparse
+import atexit
+import os
+import subprocess
+import sys
+
+SERVERS = ('gunicorn', 'waitress')
+
+
+def run_collector(host, metrics_port):
+    """Start the app as the collector and keep its scheduler running"""
+    import app
+    from metrics import start_http_server
+    app.create_app('collector')
+    if metrics_port:
+        start_http_server(metrics_port, host)
+        print(f"Collector metrics on {host}:{metrics_port}/metrics")
+    app.scheduler_thread.join()
+
+
+def start_collector(host, metrics_port):
+    """Start the collector as a child process, stopped when this process exits"""
+    collector = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'collector',
+                                  '--host', host, '--metrics-port', str(metrics_port)])
+    owner = os.getpid()
+
+    def stop():
+        # gunicorn workers are forks of this process and inherit its exit handlers
+        if os.getpid() == owner and collector.poll() is None:
+            collector.terminate()
+    atexit.register(stop)
+    return collector
+
+
+def available_server():
+    if sys.platform != 'win32':
+        try:
+            import gunicorn  # noqa: F401
+            return 'gunicorn'
+        except ImportError:
+            pass
+    return 'waitress'
+
+
+def serve_gunicorn(host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            # /api/events streams hold a thread each for as long as the dashboard is open
+            self.cfg.set('timeout', 0)
+
+        def load(self):
+            # Created in each worker after the fork, so every worker follows the store itself
+            from app import create_app
+            return create_app('web')
+
+    Application().run()
+
+
+def serve_waitress(host, port, threads):
+    from waitress import serve
+    from app import create_app
+    # Lookahead lets waitress notice a closed connection while its request
+    # is still running, so /api/events streams end as soon as the tab does
+    serve(create_app('web'), host=host, port=port, threads=threads, channel_request_lookahead=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('role', nargs='?', choices=('all', 'collector', 'web'), default='all',
+                        help="'all' starts the collector process and the API (default)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--server', choices=SERVERS, help='WSGI server (default: gunicorn if available)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker process for API requests')
+    parser.add_argument('--sse-clients', type=int, default=8,
+                        help='/api/events streams per worker process, served by threads of their own')
+    parser.add_argument('--metrics-port', type=int, default=9108,
+                        help="port of the collector's Prometheus metrics (0: not served)")
+    args = parser.parse_args()
+
+    if args.role == 'collector':
+        run_collector(args.host, args.metrics_port)
+        return
+
+    if args.role == 'all':
+        collector = start_collector(args.host, args.metrics_port)
+        print(f"Collector process started (pid {collector.pid})")
+
+    # Read by app.py on import, in this process and the gunicorn workers forked from it
+    os.environ['LICSTATS_MAX_SSE_CLIENTS'] = str(args.sse_clients)
+    threads = args.threads + args.sse_clients
+
+    server = args.server or available_server()
+    print(f"Serving the API with {server} on {args.host}:{args.port}")
+    if server == 'gunicorn':
+        serve_gunicorn(args.host, args.port, args.workers, threads)
+    else:
+        serve_waitress(args.host, args.port, threads)
+
+
+if __name__ == '__main__':
+    main()
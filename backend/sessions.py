@@ -0,0 +1,342 @@
+"""Checkout session reconstruction from consecutive lmstat snapshots
+
+A checkout is identified by (feature, user, host, connection handle, lmstat
+start time). It opens in the first snapshot that lists it and closes in the
+first later snapshot that does not. Snapshots must be observed in capture
+order; the tracker keeps a watermark and a backfill of older captures is
+handled by rebuild(). A rebuild in another process (backfill.py) renumbers
+the sessions, so trackers reload their open sessions when it happened.
+"""
+from datetime import datetime, timedelta
+
+WATERMARK_KEY = 'sessions_watermark'
+# Changed by every rebuild(), telling trackers in other processes to reload
+GENERATION_KEY = 'sessions_generation'
+START_TIME_FORMAT = '%a %m/%d %H:%M'
+
+QUERY_DIMENSIONS = ('user', 'host', 'feature')
+
+# Aggregates available to query(); durations are clipped to the window like
+# report() does. :start/:end are the window bounds, NULL when open-ended.
+# SQLite evaluates an aggregate that appears twice only once, so the total
+# and the average share one pass over the clipped durations.
+_CLIPPED_MINUTES = ("MAX(0, (julianday(MIN(COALESCE(ended_at, last_seen), COALESCE(:end, '9999'))) "
+                    "- julianday(MAX(started_at, COALESCE(:start, '')))) * 1440)")
+QUERY_METRICS = {
+    'sessions': 'COUNT(*)',
+    'open_sessions': 'SUM(ended_at IS NULL)',
+    'users': 'COUNT(DISTINCT user)',
+    'hosts': 'COUNT(DISTINCT host)',
+    'features': 'COUNT(DISTINCT feature)',
+    'total_duration_minutes': f'ROUND(SUM({_CLIPPED_MINUTES}), 1)',
+    'avg_duration_minutes': f'ROUND(SUM({_CLIPPED_MINUTES}) / COUNT(*), 1)',
+    'first_started': 'MIN(started_at)',
+    'last_seen': 'MAX(COALESCE(ended_at, last_seen))'
+}
+
+
+def parse_start_time(start_time, reference):
+    """Resolve an lmstat start like 'Mon 7/7 9:47' (no year) against the capture time
+
+    The year is the one that puts the start at or before the capture; if the
+    string cannot be parsed the capture time itself is used.
+    """
+    try:
+        # strptime needs a year to accept Feb 29, so parse with the reference year first
+        parsed = datetime.strptime(f"{reference.year} {start_time}", f"%Y {START_TIME_FORMAT}")
+    except ValueError:
+        try:
+            parsed = datetime.strptime(f"{reference.year - 1} {start_time}", f"%Y {START_TIME_FORMAT}")
+        except ValueError:
+            return reference
+    if parsed > reference + timedelta(days=1):
+        try:
+            parsed = parsed.replace(year=parsed.year - 1)
+        except ValueError:
+            return reference
+    return parsed
+
+
+def session_key(feature, user):
+    return (feature, user['user'], user['host'], user['connection'], user['start_time'])
+
+
+class SessionTracker:
+    """Maintains checkout_sessions incrementally as snapshots arrive"""
+
+    def __init__(self, store, auto_rebuild=True):
+        self.store = store
+        self._open = {}  # session key -> (session id, started_at)
+        self.watermark = None
+        self._generation = None
+        self._load_state()
+
+        # Stores that predate session tracking are replayed once
+        if auto_rebuild and self.watermark is None and self.store.latest_snapshot() is not None:
+            self.rebuild()
+
+    def _load_state(self):
+        self._open = {}
+        for row in self.store.execute(
+                'SELECT id, feature, user, host, connection, start_time, started_at '
+                'FROM checkout_sessions WHERE ended_at IS NULL'):
+            key = (row['feature'], row['user'], row['host'], row['connection'], row['start_time'])
+            self._open[key] = (row['id'], row['started_at'])
+        watermark = self.store.get_meta(WATERMARK_KEY)
+        self.watermark = datetime.fromisoformat(watermark) if watermark else None
+        self._generation = self.store.get_meta(GENERATION_KEY)
+
+    def observe(self, timestamp, licenses):
+        """Fold one snapshot into the sessions table and return its open/close events
+
+        Snapshots at or before the watermark are ignored; call rebuild() after
+        ingesting history out of order.
+        """
+        with self.store.transaction() as conn:
+            # Take SQLite's write lock before looking, so a rebuild by another
+            # process has either committed already or waits for this snapshot
+            conn.execute('BEGIN IMMEDIATE')
+            if self.store.get_meta(GENERATION_KEY) != self._generation:
+                self._load_state()
+            if self.watermark is not None and timestamp <= self.watermark:
+                return []
+            return self._apply(conn, timestamp, licenses)
+
+    def _apply(self, conn, timestamp, licenses):
+        seen_at = timestamp.isoformat()
+        events = []
+        present = {}
+        for license_data in licenses:
+            for user in license_data['users']:
+                present.setdefault(session_key(license_data['feature'], user), user)
+
+        for key, (session_id, started_at) in list(self._open.items()):
+            if key not in present:
+                conn.execute('UPDATE checkout_sessions SET ended_at = ? WHERE id = ?', (seen_at, session_id))
+                del self._open[key]
+                events.append(_event('close', key, seen_at, started_at))
+
+        for key in present:
+            if key in self._open:
+                continue
+            started_at = parse_start_time(key[4], timestamp).isoformat()
+            cursor = conn.execute(
+                'INSERT INTO checkout_sessions (feature, user, host, connection, start_time, '
+                'started_at, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                key + (started_at, seen_at, seen_at))
+            self._open[key] = (cursor.lastrowid, started_at)
+            events.append(_event('open', key, seen_at, started_at))
+
+        # Every session still open was seen in this snapshot
+        conn.execute('UPDATE checkout_sessions SET last_seen = ? WHERE ended_at IS NULL', (seen_at,))
+        conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                     'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (WATERMARK_KEY, seen_at))
+        self.watermark = timestamp
+        return events
+
+    def rebuild(self):
+        """Recompute every session by replaying the stored snapshots in capture order"""
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM checkout_sessions')
+            conn.execute('DELETE FROM meta WHERE key = ?', (WATERMARK_KEY,))
+            self._generation = datetime.now().isoformat()
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                         'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (GENERATION_KEY, self._generation))
+            self._open = {}
+            self.watermark = None
+            # Streamed rather than fetched, a long history does not fit in memory
+            for _, timestamp, licenses in self.store.replay():
+                self._apply(conn, timestamp, licenses)
+
+    def sessions(self, start=None, end=None, user=None, feature=None, open_only=False, limit=1000):
+        """List sessions overlapping [start, end), newest first"""
+        where, params = _overlap_clause(start, end, user, feature)
+        if open_only:
+            where.append('ended_at IS NULL')
+        sql = 'SELECT * FROM checkout_sessions'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY started_at DESC LIMIT :limit'
+        rows = self.store.execute(sql, dict(params, limit=limit))
+        return [_session_dict(row, start, end) for row in rows]
+
+    def iter_sessions(self, start=None, end=None):
+        """Yield every session overlapping [start, end), oldest first, without a limit
+
+        Rows are streamed from the cursor, so exporting a long history holds
+        one batch of rows at a time.
+        """
+        where, params = _overlap_clause(start, end, None, None)
+        sql = 'SELECT * FROM checkout_sessions'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        for row in self.store.execute(sql + ' ORDER BY started_at, id', params):
+            yield _session_dict(row, start, end)
+
+    def query(self, start=None, end=None, user=None, host=None, feature=None,
+              group_by=(), sort='total_duration_minutes', top=20):
+        """Aggregate sessions overlapping [start, end) by any of user/host/feature
+
+        user, host and feature filter on one value or a list of values, each
+        answered from that column's index. Returns (rows, total group count)
+        with rows holding the group columns and every QUERY_METRICS value,
+        the top N by sort (descending).
+        """
+        group_by = tuple(group_by)
+        unknown = [d for d in group_by if d not in QUERY_DIMENSIONS]
+        if unknown or len(set(group_by)) != len(group_by):
+            raise ValueError(f"group_by must be distinct values of {', '.join(QUERY_DIMENSIONS)}")
+        if sort not in QUERY_METRICS:
+            raise ValueError(f"Cannot sort by {sort}; use one of {', '.join(QUERY_METRICS)}")
+
+        where, params = _overlap_clause(start, end, user, feature, host)
+        # The duration metrics clip to the window even when it is open-ended
+        params.setdefault('start', None)
+        params.setdefault('end', None)
+
+        # Without a user/host/feature filter every session in the window is
+        # read anyway; a plain table scan beats walking a dimension index
+        table = 'checkout_sessions' if user or host or feature else 'checkout_sessions NOT INDEXED'
+        filters = (' WHERE ' + ' AND '.join(where)) if where else ''
+        grouping = (' GROUP BY ' + ', '.join(group_by)) if group_by else ''
+        columns = list(group_by) + [f'{sql} AS {name}' for name, sql in QUERY_METRICS.items()]
+        rows = self.store.execute(
+            f"SELECT {', '.join(columns)}, COUNT(*) OVER () AS total_groups FROM {table}{filters}{grouping} "
+            f"ORDER BY {sort} DESC, {', '.join(group_by + ('1',))} LIMIT :top",
+            dict(params, top=top)).fetchall()
+
+        results = []
+        total = 0
+        for row in rows:
+            # Without group_by the aggregate yields one row even when nothing matched
+            if row['sessions']:
+                result = dict(row)
+                total = result.pop('total_groups')
+                results.append(result)
+        return results, total
+
+    def report(self, group_by='user', start=None, end=None, user=None, feature=None):
+        """Per-user or per-feature checkout totals for sessions overlapping the window
+
+        Durations are clipped to the window; peak_concurrent is the largest
+        number of the group's sessions open at the same moment.
+        """
+        if group_by not in ('user', 'feature', 'host'):
+            raise ValueError(f"Cannot group sessions by {group_by}")
+        where, params = _overlap_clause(start, end, user, feature)
+        sql = 'SELECT * FROM checkout_sessions'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+
+        groups = {}
+        for row in self.store.execute(sql, params):
+            session = _session_dict(row, start, end)
+            groups.setdefault(row[group_by], []).append(session)
+
+        start_iso = start.isoformat() if start else ''
+        report = []
+        for name, items in groups.items():
+            total = sum(s['duration_minutes'] for s in items)
+            report.append({
+                group_by: name,
+                'sessions': len(items),
+                'open_sessions': sum(1 for s in items if s['open']),
+                'opened': sum(1 for s in items if s['first_seen'] >= start_iso),
+                'closed': sum(1 for s in items if s['ended_at'] and s['ended_at'] >= start_iso),
+                'total_duration_minutes': round(total, 1),
+                'avg_duration_minutes': round(total / len(items), 1),
+                'peak_concurrent': _peak_concurrent(items)
+            })
+        report.sort(key=lambda r: r['total_duration_minutes'], reverse=True)
+        return report
+
+
+def _overlap_clause(start, end, user, feature, host=None):
+    """WHERE terms and named parameters selecting sessions overlapping [start, end)
+
+    user, host and feature take one value or a list; each is an IN lookup on
+    that column's index.
+    """
+    where, params = [], {}
+    for column, values in (('user', user), ('host', host), ('feature', feature)):
+        if not values:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        names = [f'{column}{i}' for i in range(len(values))]
+        where.append(f"{column} IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, values))
+    if end:
+        where.append('started_at < :end')
+        params['end'] = end.isoformat()
+    if start:
+        where.append('(ended_at IS NULL OR ended_at >= :start)')
+        params['start'] = start.isoformat()
+    return where, params
+
+
+def checkout_events(previous, licenses, timestamp):
+    """Open/close events between two snapshots' licenses, as observe() reports them
+
+    For processes that read the sessions table rather than maintain it;
+    started_at of a closed checkout is resolved against timestamp.
+    """
+    seen_at = timestamp.isoformat()
+    before = {session_key(lic['feature'], user) for lic in previous for user in lic['users']}
+    after = {session_key(lic['feature'], user) for lic in licenses for user in lic['users']}
+    events = [_event('close', key, seen_at, parse_start_time(key[4], timestamp).isoformat())
+              for key in sorted(before - after)]
+    events.extend(_event('open', key, seen_at, parse_start_time(key[4], timestamp).isoformat())
+                  for key in sorted(after - before))
+    return events
+
+
+def _session_dict(row, start=None, end=None):
+    begin = datetime.fromisoformat(row['started_at'])
+    finish = datetime.fromisoformat(row['ended_at'] or row['last_seen'])
+    if start:
+        begin = max(begin, start)
+    if end:
+        finish = min(finish, end)
+    return {
+        'id': row['id'],
+        'feature': row['feature'],
+        'user': row['user'],
+        'host': row['host'],
+        'connection': row['connection'],
+        'start_time': row['start_time'],
+        'started_at': row['started_at'],
+        'first_seen': row['first_seen'],
+        'last_seen': row['last_seen'],
+        'ended_at': row['ended_at'],
+        'open': row['ended_at'] is None,
+        'duration_minutes': round(max((finish - begin).total_seconds(), 0) / 60, 1)
+    }
+
+
+def _peak_concurrent(sessions):
+    points = []
+    for s in sessions:
+        points.append((s['started_at'], 1))
+        points.append((s['ended_at'] or s['last_seen'], -1))
+    # Closes sort before opens at the same instant
+    points.sort(key=lambda p: (p[0], p[1]))
+    peak = current = 0
+    for _, delta in points:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def _event(kind, key, timestamp, started_at):
+    feature, user, host, connection, start_time = key
+    return {
+        'event': kind,
+        'timestamp': timestamp,
+        'feature': feature,
+        'user': user,
+        'host': host,
+        'connection': connection,
+        'start_time': start_time,
+        'started_at': started_at
+    }
@@ -0,0 +1,916 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from compact import SnapshotWindow
+from diff import apply_delta, encode_delta, keyframe, keyframe_state, snapshot_state, state_licenses
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    filename TEXT NOT NULL UNIQUE,
+    total_in_use INTEGER NOT NULL,
+    total_users INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_timestamp ON snapshots(timestamp);
+
+-- Parsed contents of each snapshot (see diff.py), zlib-compressed JSON. A
+-- keyframe (base_id NULL) holds the full state; any other frame is a delta
+-- against base_id, normally the previous capture. depth counts the deltas
+-- back to the keyframe, which bounds the cost of loading one snapshot.
+CREATE TABLE IF NOT EXISTS snapshot_frames (
+    snapshot_id INTEGER PRIMARY KEY REFERENCES snapshots(id) ON DELETE CASCADE,
+    base_id INTEGER,
+    depth INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+
+-- Rollups are keyed by (resolution, bucket start). Feature rows only exist for
+-- features seen in use during the bucket; samples counts those snapshots, so
+-- a feature idle in part of a bucket has an effective minimum of 0.
+CREATE TABLE IF NOT EXISTS rollup_global (
+    resolution TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    in_use_min INTEGER NOT NULL,
+    in_use_max INTEGER NOT NULL,
+    in_use_sum INTEGER NOT NULL,
+    PRIMARY KEY (resolution, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_feature (
+    resolution TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    in_use_min INTEGER NOT NULL,
+    in_use_max INTEGER NOT NULL,
+    in_use_sum INTEGER NOT NULL,
+    PRIMARY KEY (resolution, bucket, feature)
+);
+
+-- Distinct users per bucket; feature '' holds the global user set
+CREATE TABLE IF NOT EXISTS rollup_users (
+    resolution TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    user TEXT NOT NULL,
+    PRIMARY KEY (resolution, bucket, feature, user)
+) WITHOUT ROWID;
+
+-- Per-hour and per-day partial window aggregates, merged on demand so a
+-- week or month window costs O(days) rather than O(snapshots). position is
+-- the feature's (or user record's) index within its snapshot, for ordering.
+CREATE TABLE IF NOT EXISTS partial_features (
+    resolution TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    peak_usage INTEGER NOT NULL,
+    in_use_sum INTEGER NOT NULL,
+    PRIMARY KEY (resolution, bucket, feature)
+);
+
+-- Most recent record of each user|host per feature within the bucket
+CREATE TABLE IF NOT EXISTS partial_users (
+    resolution TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    user TEXT NOT NULL,
+    host TEXT NOT NULL,
+    connection TEXT,
+    start_time TEXT,
+    linger TEXT,
+    details TEXT,
+    last_seen TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (resolution, bucket, feature, user, host)
+);
+
+-- Checkout sessions reconstructed from consecutive snapshots (see sessions.py).
+-- started_at is the lmstat start time resolved to a full date; ended_at is the
+-- first snapshot the checkout was missing from, NULL while it is still open.
+CREATE TABLE IF NOT EXISTS checkout_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    feature TEXT NOT NULL,
+    user TEXT NOT NULL,
+    host TEXT NOT NULL,
+    connection TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    ended_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_checkout_sessions_user ON checkout_sessions(user, started_at);
+CREATE INDEX IF NOT EXISTS idx_checkout_sessions_feature ON checkout_sessions(feature, started_at);
+CREATE INDEX IF NOT EXISTS idx_checkout_sessions_host ON checkout_sessions(host, started_at);
+CREATE INDEX IF NOT EXISTS idx_checkout_sessions_ended ON checkout_sessions(ended_at);
+CREATE INDEX IF NOT EXISTS idx_checkout_sessions_open ON checkout_sessions(id) WHERE ended_at IS NULL;
+
+-- Per-feature (total, in_use) change points: a point at a capture time holds
+-- the values from that capture until the feature's next point. A feature
+-- missing from a capture is recorded as (0, 0). One row per feature and day
+-- (days since 1970-01-01 of the naive capture time); data packs ascending
+-- int32 triples (second of the day, total, in_use) that analytics.py reads
+-- straight into NumPy arrays.
+CREATE TABLE IF NOT EXISTS feature_changes (
+    feature TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (feature, day)
+) WITHOUT ROWID;
+
+-- Plain .txt captures in the logs directory (see logindex.py); timestamp is
+-- the capture time from the filename, or the mtime of files named otherwise
+CREATE TABLE IF NOT EXISTS log_files (
+    filename TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Rollup resolutions, finest first, with the bucket length used to pick one
+ROLLUP_RESOLUTIONS = (
+    ('minute', timedelta(minutes=1)),
+    ('hour', timedelta(hours=1)),
+    ('day', timedelta(days=1)),
+)
+
+PARTIAL_RESOLUTIONS = ('hour', 'day')
+KEYFRAME_INTERVAL = 60  # a full frame at least every this many snapshots of a chain
+EPOCH = datetime(1970, 1, 1)  # day 0 of feature_changes
+DERIVED_TABLES = ('rollup_global', 'rollup_feature', 'rollup_users', 'partial_features', 'partial_users',
+                  'feature_changes')
+
+
+class DerivedAggregate:
+    """Rollup and partial-window contributions of a run of snapshots, folded in memory
+
+    Folding is associative (min/max/sum, set union, newest record wins), so an
+    aggregate of many snapshots can be written with one upsert per bucket.
+    """
+
+    def __init__(self):
+        self.rollup_global = {}     # (resolution, bucket) -> [samples, min, max, sum]
+        self.rollup_feature = {}    # (resolution, bucket, feature) -> [samples, min, max, sum]
+        self.rollup_users = set()   # (resolution, bucket, feature, user)
+        self.partial_features = {}  # (resolution, bucket, feature) -> [position, total, peak, sum]
+        self.partial_users = {}     # (resolution, bucket, feature, user, host) -> record tuple
+
+    def size(self):
+        return (len(self.rollup_global) + len(self.rollup_feature) + len(self.rollup_users)
+                + len(self.partial_features) + len(self.partial_users))
+
+    def add(self, timestamp, licenses):
+        """Fold one snapshot in"""
+        feature_in_use = {}
+        feature_users = set()
+        for l in licenses:
+            if l['in_use'] > 0:
+                feature_in_use[l['feature']] = feature_in_use.get(l['feature'], 0) + l['in_use']
+            for u in l['users']:
+                feature_users.add((l['feature'], u['user']))
+                feature_users.add(('', u['user']))
+        total_in_use = sum(feature_in_use.values())
+
+        for resolution, _ in ROLLUP_RESOLUTIONS:
+            bucket = bucket_start(timestamp, resolution).isoformat()
+            _fold_stats(self.rollup_global, (resolution, bucket), total_in_use)
+            for feature, in_use in feature_in_use.items():
+                _fold_stats(self.rollup_feature, (resolution, bucket, feature), in_use)
+            for feature, user in feature_users:
+                self.rollup_users.add((resolution, bucket, feature, user))
+
+        last_seen = timestamp.isoformat()
+        for resolution in PARTIAL_RESOLUTIONS:
+            bucket = bucket_start(timestamp, resolution).isoformat()
+            for position, l in enumerate(licenses):
+                key = (resolution, bucket, l['feature'])
+                agg = self.partial_features.get(key)
+                if agg is None:
+                    self.partial_features[key] = [position, l['total'], l['in_use'], l['in_use']]
+                else:
+                    agg[0] = min(agg[0], position)
+                    agg[1] = max(agg[1], l['total'])
+                    agg[2] = max(agg[2], l['in_use'])
+                    agg[3] += l['in_use']
+
+            position = 0
+            for l in licenses:
+                for u in l['users']:
+                    key = (resolution, bucket, l['feature'], u['user'], u['host'])
+                    current = self.partial_users.get(key)
+                    if current is None or last_seen > current[4]:
+                        self.partial_users[key] = (u['connection'], u['start_time'], u['linger'],
+                                                   u['details'], last_seen, position)
+                    position += 1
+
+
+class SnapshotStore:
+    """SQLite store of parsed lmstat snapshots, indexed by capture time"""
+
+    def __init__(self, path, migrate=True):
+        """migrate=False skips upgrading old layouts and computing missing derived
+        tables, for readers that share the store with the process that writes it"""
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._tail = None  # (snapshot id, state, depth) of the last frame written
+        self._successor = None  # (snapshot id, state) of the capture after a backfilled one
+        self._recent = None  # SnapshotWindow of the latest hours, see keep_recent()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+        if not migrate:
+            return
+
+        # Stores from before delta encoding kept every snapshot in full
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'features'").fetchone():
+            self._migrate_to_frames()
+
+        # Stores created before a derived table existed get it computed once
+        has_snapshots = conn.execute('SELECT 1 FROM snapshots LIMIT 1').fetchone()
+        missing_derived = any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None
+                              for table in ('rollup_global', 'partial_features', 'feature_changes'))
+        if has_snapshots and missing_derived:
+            self.rebuild_derived()
+
+    def _connection(self):
+        """Return the SQLite connection owned by the calling thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        """Run a read query on the calling thread's connection"""
+        return self._connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Hold the write lock and commit (or roll back) the block's writes"""
+        with self._write_lock:
+            conn = self._connection()
+            try:
+                with conn:
+                    yield conn
+            except BaseException:
+                # The cached last frame may have been rolled back
+                self._tail = None
+                self._successor = None
+                raise
+
+    def get_meta(self, key, default=None):
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key, value):
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                         'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (key, value))
+
+    def has_snapshot(self, filename):
+        row = self._connection().execute(
+            'SELECT 1 FROM snapshots WHERE filename = ?', (filename,)).fetchone()
+        return row is not None
+
+    def clear(self):
+        """Delete every snapshot and everything derived from them"""
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                for table in ('snapshot_frames', 'snapshots', 'checkout_sessions', 'meta') + DERIVED_TABLES:
+                    conn.execute(f'DELETE FROM {table}')
+                self._tail = None
+                self._successor = None
+            if self._recent is not None:
+                self._recent = SnapshotWindow(self._recent.hours)
+
+    def known_filenames(self):
+        """Return the set of capture filenames already ingested"""
+        rows = self._connection().execute('SELECT filename FROM snapshots')
+        return {row['filename'] for row in rows}
+
+    def add_snapshot(self, timestamp, filename, licenses):
+        """Store one parsed capture and return its snapshot id"""
+        with self.transaction() as conn:
+            snapshot_id = self._insert_snapshot(conn, timestamp, filename, licenses)
+            if snapshot_id is not None:
+                derived = DerivedAggregate()
+                derived.add(timestamp, licenses)
+                self._write_derived(conn, derived)
+            return snapshot_id
+
+    def add_snapshots(self, snapshots, derived=None):
+        """Store many (timestamp, filename, licenses) captures in one transaction
+
+        derived may carry the captures' rollup/partial contributions already
+        folded together (e.g. by a backfill worker); it is only used when every
+        capture is new, otherwise the contributions are recomputed from the
+        inserted ones. Returns the number of captures inserted.
+        """
+        snapshots = list(snapshots)
+        inserted = []
+        with self.transaction() as conn:
+            for timestamp, filename, licenses in snapshots:
+                if self._insert_snapshot(conn, timestamp, filename, licenses) is not None:
+                    inserted.append((timestamp, licenses))
+
+            if derived is None or len(inserted) != len(snapshots):
+                derived = DerivedAggregate()
+                for timestamp, licenses in inserted:
+                    derived.add(timestamp, licenses)
+            self._write_derived(conn, derived)
+        return len(inserted)
+
+    def _insert_snapshot(self, conn, timestamp, filename, licenses):
+        total_in_use = sum(l['in_use'] for l in licenses)
+        total_users = len({u['user'] for l in licenses for u in l['users']})
+
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO snapshots (timestamp, filename, total_in_use, total_users) '
+            'VALUES (?, ?, ?, ?)',
+            (timestamp.isoformat(), filename, total_in_use, total_users))
+        if cursor.rowcount == 0:
+            # Already ingested (e.g. re-running a sync over the same logs)
+            return None
+        snapshot_id = cursor.lastrowid
+        state = snapshot_state(licenses)
+        previous_state = self._write_frame(conn, snapshot_id, timestamp.isoformat(), state)
+        self._write_feature_changes(conn, snapshot_id, timestamp.isoformat(), previous_state, state)
+        return snapshot_id
+
+    def _write_frame(self, conn, snapshot_id, timestamp, state):
+        """Store a snapshot's state as a delta against the capture before it, or a keyframe
+
+        Returns the state of that previous capture (None for the first one).
+        """
+        # Compared as a row value this is one index seek; the equivalent OR of
+        # two conditions made SQLite read and sort every earlier snapshot
+        previous = conn.execute(
+            'SELECT s.id, f.depth FROM snapshots s JOIN snapshot_frames f ON f.snapshot_id = s.id '
+            'WHERE (s.timestamp, s.id) < (?, ?) ORDER BY s.timestamp DESC, s.id DESC LIMIT 1',
+            (timestamp, snapshot_id)).fetchone()
+
+        base_state = None
+        if previous is not None:
+            # Captures mostly arrive in order, so the base is usually the one just written
+            if self._tail is not None and self._tail[0] == previous['id']:
+                base_state = self._tail[1]
+            else:
+                base_state = self._load_state(conn, previous['id'])
+
+        if previous is None or previous['depth'] + 1 >= KEYFRAME_INTERVAL:
+            base_id, depth, frame = None, 0, keyframe(state)
+        else:
+            base_id, depth, frame = previous['id'], previous['depth'] + 1, encode_delta(base_state, state)
+
+        conn.execute('INSERT INTO snapshot_frames (snapshot_id, base_id, depth, data) VALUES (?, ?, ?, ?)',
+                     (snapshot_id, base_id, depth, _encode_frame(frame)))
+        self._tail = (snapshot_id, state, depth)
+        return base_state
+
+    def _write_feature_changes(self, conn, snapshot_id, timestamp, previous_state, state):
+        """Record the features whose (total, in_use) differ from the previous capture
+
+        A capture backfilled before newer ones also becomes the predecessor of
+        the next capture, which then gets rows for whatever differs from it.
+        """
+        values = _feature_values(state)
+        previous_values = _feature_values(previous_state)
+        _merge_feature_changes(conn, _changed_features(previous_values, values, timestamp))
+
+        following = conn.execute(
+            'SELECT id, timestamp FROM snapshots WHERE (timestamp, id) > (?, ?) '
+            'ORDER BY timestamp, id LIMIT 1', (timestamp, snapshot_id)).fetchone()
+        if following is None:
+            return
+        # A backfill run inserts many captures before the same successor
+        if self._successor is None or self._successor[0] != following['id']:
+            self._successor = (following['id'], self._load_state(conn, following['id']))
+        successor_values = _feature_values(self._successor[1])
+        # Points of the successor that now repeat this capture's values are redundant
+        _merge_feature_changes(
+            conn, _changed_features(values, successor_values, following['timestamp']),
+            drop=[(feature, following['timestamp']) + values.get(feature, (0, 0))
+                  for feature in values.keys() | previous_values.keys()
+                  if successor_values.get(feature, (0, 0)) == values.get(feature, (0, 0))])
+
+    def _load_state(self, conn, snapshot_id):
+        """Reconstruct one snapshot's state from its keyframe and the deltas after it"""
+        frames = conn.execute(
+            'WITH RECURSIVE chain (snapshot_id, base_id, data, step) AS ('
+            ' SELECT snapshot_id, base_id, data, 0 FROM snapshot_frames WHERE snapshot_id = ?'
+            ' UNION ALL SELECT f.snapshot_id, f.base_id, f.data, chain.step + 1'
+            ' FROM snapshot_frames f JOIN chain ON f.snapshot_id = chain.base_id) '
+            'SELECT base_id, data FROM chain ORDER BY step DESC', (snapshot_id,)).fetchall()
+        if not frames or frames[0]['base_id'] is not None:
+            return None
+        state = keyframe_state(_decode_frame(frames[0]['data']))
+        for frame in frames[1:]:
+            state = apply_delta(state, _decode_frame(frame['data']))
+        return state
+
+    def _migrate_to_frames(self):
+        """Re-encode the full per-snapshot features/user_sessions tables as frames, then drop them"""
+        print("Migrating snapshot store to delta-encoded frames")
+        with self.transaction() as conn:
+            for snapshot in conn.execute('SELECT id, timestamp FROM snapshots ORDER BY timestamp, id').fetchall():
+                features = [(row['feature'], row['total'], row['in_use']) for row in conn.execute(
+                    'SELECT feature, total, in_use FROM features WHERE snapshot_id = ? ORDER BY rowid',
+                    (snapshot['id'],))]
+                users = [tuple(row) for row in conn.execute(
+                    'SELECT feature, user, host, connection, start_time, linger, details '
+                    'FROM user_sessions WHERE snapshot_id = ? ORDER BY rowid', (snapshot['id'],))]
+                self._write_frame(conn, snapshot['id'], snapshot['timestamp'], (features, users))
+            conn.execute('DROP TABLE user_sessions')
+            conn.execute('DROP TABLE features')
+        # Return the space of the dropped tables to the filesystem
+        self._connection().execute('VACUUM')
+
+    def _write_derived(self, conn, derived):
+        """Merge a DerivedAggregate into the rollup and partial tables"""
+        conn.executemany(
+            'INSERT INTO rollup_global (resolution, bucket, samples, in_use_min, in_use_max, in_use_sum) '
+            'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (resolution, bucket) DO UPDATE SET '
+            'samples = samples + excluded.samples, in_use_min = MIN(in_use_min, excluded.in_use_min), '
+            'in_use_max = MAX(in_use_max, excluded.in_use_max), '
+            'in_use_sum = in_use_sum + excluded.in_use_sum',
+            [key + tuple(stats) for key, stats in derived.rollup_global.items()])
+        conn.executemany(
+            'INSERT INTO rollup_feature (resolution, bucket, feature, samples, in_use_min, in_use_max, in_use_sum) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (resolution, bucket, feature) DO UPDATE SET '
+            'samples = samples + excluded.samples, in_use_min = MIN(in_use_min, excluded.in_use_min), '
+            'in_use_max = MAX(in_use_max, excluded.in_use_max), '
+            'in_use_sum = in_use_sum + excluded.in_use_sum',
+            [key + tuple(stats) for key, stats in derived.rollup_feature.items()])
+        conn.executemany(
+            'INSERT OR IGNORE INTO rollup_users (resolution, bucket, feature, user) VALUES (?, ?, ?, ?)',
+            derived.rollup_users)
+        conn.executemany(
+            'INSERT INTO partial_features (resolution, bucket, feature, position, total, peak_usage, in_use_sum) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (resolution, bucket, feature) DO UPDATE SET '
+            'position = MIN(position, excluded.position), total = MAX(total, excluded.total), '
+            'peak_usage = MAX(peak_usage, excluded.peak_usage), '
+            'in_use_sum = in_use_sum + excluded.in_use_sum',
+            [key + tuple(stats) for key, stats in derived.partial_features.items()])
+        # A strictly newer record replaces the stored one, so within one
+        # snapshot the first record of a user|host wins
+        conn.executemany(
+            'INSERT INTO partial_users (resolution, bucket, feature, user, host, connection, start_time, '
+            'linger, details, last_seen, position) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (resolution, bucket, feature, user, host) DO UPDATE SET '
+            'connection = excluded.connection, start_time = excluded.start_time, '
+            'linger = excluded.linger, details = excluded.details, '
+            'last_seen = excluded.last_seen, position = excluded.position '
+            'WHERE excluded.last_seen > partial_users.last_seen',
+            [key + record for key, record in derived.partial_users.items()])
+
+    def rebuild_derived(self):
+        """Recompute every rollup and partial aggregate from the stored snapshots"""
+        conn = self._connection()
+        with self._write_lock:
+            with conn:
+                for table in DERIVED_TABLES:
+                    conn.execute(f'DELETE FROM {table}')
+                derived = DerivedAggregate()
+                values = {}
+                changes = []
+                for _, timestamp, licenses in self.replay():
+                    derived.add(timestamp, licenses)
+                    current = {l['feature']: (l['total'], l['in_use']) for l in reversed(licenses)}
+                    changes.extend(_changed_features(values, current, timestamp.isoformat()))
+                    values = current
+                    if derived.size() + len(changes) > 100000:
+                        self._write_derived(conn, derived)
+                        _merge_feature_changes(conn, changes)
+                        derived = DerivedAggregate()
+                        changes = []
+                self._write_derived(conn, derived)
+                _merge_feature_changes(conn, changes)
+
+    def prune_rollups(self, resolution, before):
+        """Drop rollup buckets of one resolution that start before the given time"""
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                for table in ('rollup_global', 'rollup_feature', 'rollup_users'):
+                    conn.execute(f'DELETE FROM {table} WHERE resolution = ? AND bucket < ?',
+                                 (resolution, before.isoformat()))
+
+    def latest_snapshot(self):
+        """Return the newest snapshot row or None"""
+        return self._connection().execute(
+            'SELECT * FROM snapshots ORDER BY timestamp DESC, id DESC LIMIT 1').fetchone()
+
+    def find_snapshot(self, at):
+        """Snapshot row for a capture filename, or the newest one at or before a datetime"""
+        conn = self._connection()
+        if isinstance(at, str):
+            return conn.execute('SELECT * FROM snapshots WHERE filename = ?', (at,)).fetchone()
+        return conn.execute('SELECT * FROM snapshots WHERE timestamp <= ? ORDER BY timestamp DESC, id DESC '
+                            'LIMIT 1', (at.isoformat(),)).fetchone()
+
+    def last_snapshot(self, start=None, end=None):
+        """Newest snapshot row in [start, end) (unbounded when None), or None"""
+        where, params = _window_clause(start, end)
+        return self._connection().execute(
+            f'SELECT * FROM snapshots s {where} ORDER BY s.timestamp DESC, s.id DESC LIMIT 1', params).fetchone()
+
+    def load_state(self, snapshot_id):
+        """(features, users) state of one snapshot (see diff.py), or None"""
+        return self._load_state(self._connection(), snapshot_id)
+
+    def load_licenses(self, snapshot_id):
+        """Rebuild the parse_license_data structure for one snapshot"""
+        state = self.load_state(snapshot_id)
+        return state_licenses(state) if state is not None else []
+
+    def keep_recent(self, hours):
+        """Hold the snapshots of the last hours in memory as compact snapshots
+
+        Opt-in and off by default: replay_recent() over a range inside the
+        window then reads memory instead of decoding frames, which measured no
+        faster (bench_memory.py: 113 ms against 114 ms for a day). Snapshots
+        written since, by this process or another, are picked up on each read.
+        """
+        window = SnapshotWindow(hours)
+        for snapshot_id, timestamp, state in self._replay_states(window.start):
+            window.add(snapshot_id, timestamp, state)
+        row = self._connection().execute('SELECT MAX(id) FROM snapshots').fetchone()
+        window.last_id = max(window.last_id, row[0] or 0)
+        self._recent = window
+
+    def _sync_recent(self, window):
+        """Add the snapshots written since the window last looked, then drop expired ones"""
+        conn = self._connection()
+        rows = conn.execute('SELECT id, timestamp FROM snapshots WHERE id > ? ORDER BY id',
+                            (window.last_id,)).fetchall()
+        for row in rows:
+            timestamp = datetime.fromisoformat(row['timestamp'])
+            if timestamp >= window.start:
+                state = self._load_state(conn, row['id'])
+                if state is not None:
+                    window.add(row['id'], timestamp, state)
+            window.last_id = max(window.last_id, row['id'])
+        window.prune()
+
+    def replay(self, start=None, end=None):
+        """Yield (snapshot id, timestamp, licenses) for snapshots in [start, end), oldest first
+
+        Each frame is decoded once and applied to the state of its base, so a
+        window costs one keyframe plus small deltas rather than full snapshots.
+        """
+        for snapshot_id, timestamp, state in self._replay_states(start, end):
+            yield snapshot_id, timestamp, state_licenses(state)
+
+    def replay_recent(self, start=None, end=None):
+        """replay(), read from the keep_recent() window when one is held and covers start"""
+        window = self._recent
+        if window is not None and window.covers(start):
+            self._sync_recent(window)
+            if window.covers(start):
+                yield from window.replay(start, end)
+                return
+        yield from self.replay(start, end)
+
+    def _replay_states(self, start=None, end=None):
+        """Yield (snapshot id, timestamp, state) for snapshots in [start, end) from the frames"""
+        conn = self._connection()
+        where, params = [], ()
+        if start is not None:
+            where.append('s.timestamp >= ?')
+            params += (start.isoformat(),)
+        if end is not None:
+            where.append('s.timestamp < ?')
+            params += (end.isoformat(),)
+        sql = ('SELECT s.id, s.timestamp, f.base_id, f.data FROM snapshots s '
+               'JOIN snapshot_frames f ON f.snapshot_id = s.id')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY s.timestamp, s.id'
+
+        recent = {}  # states of the last few snapshots, the bases of the next frames
+        for row in conn.execute(sql, params):
+            frame = _decode_frame(row['data'])
+            if row['base_id'] is None:
+                state = keyframe_state(frame)
+            else:
+                base = recent.get(row['base_id'])
+                if base is None:
+                    base = self._load_state(conn, row['base_id'])
+                state = apply_delta(base, frame)
+            recent[row['id']] = state
+            if len(recent) > 8:
+                del recent[next(iter(recent))]
+            yield row['id'], datetime.fromisoformat(row['timestamp']), state
+
+    def aggregate_licenses(self, start=None, end=None):
+        """Aggregate peak usage, usage sums and distinct users per feature in [start, end)
+
+        The window is split into whole days and whole hours, read from the
+        partial aggregate tables, plus the raw snapshots of the partial hours
+        at either end. Returns {feature: {'total', 'peak_usage', 'in_use_sum',
+        'users'}} in feature order, or {} when the window has no snapshots.
+        """
+        conn = self._connection()
+        where, params = _window_clause(start, end)
+        if not conn.execute(f'SELECT 1 FROM snapshots s {where} LIMIT 1', params).fetchone():
+            return {}
+
+        features = {}
+        users = {}
+
+        hour_from = _ceil_bucket(start, 'hour') if start else None
+        day_from = _ceil_bucket(start, 'day') if start else None
+        hour_to = bucket_start(end, 'hour') if end else None
+        day_to = bucket_start(end, 'day') if end else None
+        raw = []
+        if start is None or end is None or day_from < day_to:
+            segments = [('day', day_from, day_to)]
+            if start:
+                segments.append(('hour', hour_from, day_from))
+                raw.append((start, hour_from))
+            if end:
+                segments.append(('hour', day_to, hour_to))
+                raw.append((hour_to, end))
+        elif hour_from < hour_to:
+            segments = [('hour', hour_from, hour_to)]
+            raw = [(start, hour_from), (hour_to, end)]
+        else:
+            # No whole hour in the window
+            segments = []
+            raw = [(start, end)]
+        for raw_from, raw_to in raw:
+            if raw_from < raw_to:
+                self._fold_raw_window(raw_from, raw_to, features, users)
+
+        for resolution, bucket_from, bucket_to in segments:
+            bucket_from = bucket_from.isoformat() if bucket_from else ''
+            bucket_to = bucket_to.isoformat() if bucket_to else None
+            bound = 'AND bucket < ?' if bucket_to else ''
+            params = (resolution, bucket_from) + ((bucket_to,) if bucket_to else ())
+            for row in conn.execute(
+                    'SELECT feature, position, total, peak_usage, in_use_sum FROM partial_features '
+                    f'WHERE resolution = ? AND bucket >= ? {bound}', params):
+                _fold_feature(features, row['feature'], row['position'], row['total'],
+                              row['peak_usage'], row['in_use_sum'])
+            for row in conn.execute(
+                    'SELECT feature, user, host, connection, start_time, linger, details, last_seen, position '
+                    f'FROM partial_users WHERE resolution = ? AND bucket >= ? {bound}', params):
+                _fold_user(users, row, row['last_seen'], row['position'])
+
+        ordered = sorted(features.items(), key=lambda item: (item[1]['position'], item[0]))
+        result = {feature: {'total': agg['total'], 'peak_usage': agg['peak_usage'],
+                            'in_use_sum': agg['in_use_sum'], 'users': []}
+                  for feature, agg in ordered}
+        # Newest first; the stable sort keeps snapshot order among equal times
+        entries = sorted(users.items(), key=lambda item: item[1][1])
+        entries.sort(key=lambda item: item[1][0], reverse=True)
+        for (feature, _, _), (_, _, row) in entries:
+            if feature in result:
+                result[feature]['users'].append(_user_from_row(row))
+        return result
+
+    def _fold_raw_window(self, start, end, features, users):
+        """Fold the snapshots in [start, end) into the aggregation dicts"""
+        for _, timestamp, licenses in self.replay_recent(start, end):
+            for index, l in enumerate(licenses):
+                _fold_feature(features, l['feature'], index, l['total'], l['in_use'], l['in_use'])
+            last_seen = timestamp.isoformat()
+            index = 0
+            for l in licenses:
+                for u in l['users']:
+                    _fold_user(users, dict(u, feature=l['feature']), last_seen, index)
+                    index += 1
+
+    def historical_summary(self, start=None, end=None):
+        """Return one summary point per snapshot in [start, end) in chronological order"""
+        where, params = _window_clause(start, end)
+        rows = self._connection().execute(
+            'SELECT timestamp, total_in_use, total_users FROM snapshots s '
+            f'{where} ORDER BY timestamp', params)
+        return [{
+            'timestamp': row['timestamp'],
+            'total_licenses_in_use': row['total_in_use'],
+            'total_users': row['total_users']
+        } for row in rows]
+
+    def first_timestamp(self):
+        """Capture time of the oldest snapshot, or None when empty"""
+        row = self._connection().execute('SELECT MIN(timestamp) FROM snapshots').fetchone()
+        return datetime.fromisoformat(row[0]) if row[0] else None
+
+    def rollup_summary(self, resolution, start=None, feature=None, end=None):
+        """Return rollup points for the global total or one feature in chronological order
+
+        Buckets holding any of [start, end) are included.
+        """
+        conn = self._connection()
+        bucket_from = bucket_start(start, resolution).isoformat() if start else ''
+        # '~' sorts after every ISO timestamp, leaving the window open-ended
+        bucket_to = end.isoformat() if end else '~'
+        user_feature = feature or ''
+
+        users = dict(conn.execute(
+            'SELECT bucket, COUNT(*) FROM rollup_users '
+            'WHERE resolution = ? AND feature = ? AND bucket >= ? AND bucket < ? GROUP BY bucket',
+            (resolution, user_feature, bucket_from, bucket_to)).fetchall())
+
+        if feature is None:
+            rows = conn.execute(
+                'SELECT bucket, samples, in_use_min, in_use_max, in_use_sum FROM rollup_global '
+                'WHERE resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket',
+                (resolution, bucket_from, bucket_to))
+        else:
+            rows = conn.execute(
+                'SELECT g.bucket, g.samples, '
+                'CASE WHEN f.samples = g.samples THEN f.in_use_min ELSE 0 END AS in_use_min, '
+                'COALESCE(f.in_use_max, 0) AS in_use_max, COALESCE(f.in_use_sum, 0) AS in_use_sum '
+                'FROM rollup_global g LEFT JOIN rollup_feature f '
+                'ON f.resolution = g.resolution AND f.bucket = g.bucket AND f.feature = ? '
+                'WHERE g.resolution = ? AND g.bucket >= ? AND g.bucket < ? ORDER BY g.bucket',
+                (feature, resolution, bucket_from, bucket_to))
+
+        return [{
+            'timestamp': row['bucket'],
+            'samples': row['samples'],
+            'total_licenses_in_use': round(row['in_use_sum'] / row['samples'], 2),
+            'in_use_min': row['in_use_min'],
+            'in_use_max': row['in_use_max'],
+            'total_users': users.get(row['bucket'], 0)
+        } for row in rows]
+
+
+def bucket_start(timestamp, resolution):
+    """Truncate a capture time to the start of its rollup bucket"""
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def choose_resolution(start, end, max_points):
+    """Pick the finest rollup resolution that keeps the window under max_points buckets"""
+    span = end - start
+    for resolution, length in ROLLUP_RESOLUTIONS:
+        if span / length <= max_points:
+            return resolution
+    return ROLLUP_RESOLUTIONS[-1][0]
+
+
+def _fold_stats(stats, key, value):
+    current = stats.get(key)
+    if current is None:
+        stats[key] = [1, value, value, value]
+    else:
+        current[0] += 1
+        current[1] = min(current[1], value)
+        current[2] = max(current[2], value)
+        current[3] += value
+
+
+def _ceil_bucket(timestamp, resolution):
+    """Start of the first whole bucket at or after timestamp"""
+    floor = bucket_start(timestamp, resolution)
+    if floor == timestamp:
+        return floor
+    return floor + (timedelta(hours=1) if resolution == 'hour' else timedelta(days=1))
+
+
+def _fold_feature(features, feature, position, total, peak_usage, in_use_sum):
+    agg = features.get(feature)
+    if agg is None:
+        features[feature] = {'position': position, 'total': total,
+                             'peak_usage': peak_usage, 'in_use_sum': in_use_sum}
+        return
+    agg['position'] = min(agg['position'], position)
+    agg['total'] = max(agg['total'], total)
+    agg['peak_usage'] = max(agg['peak_usage'], peak_usage)
+    agg['in_use_sum'] += in_use_sum
+
+
+def _fold_user(users, row, last_seen, position):
+    """Keep the most recent record per feature|user|host (first within a snapshot)"""
+    key = (row['feature'], row['user'], row['host'])
+    current = users.get(key)
+    if current is None or last_seen > current[0] or (last_seen == current[0] and position < current[1]):
+        users[key] = (last_seen, position, row)
+
+
+def _feature_values(state):
+    """{feature: (total, in_use)} of a state, first row winning like the other views"""
+    if state is None:
+        return {}
+    return {feature: (total, in_use) for feature, total, in_use in reversed(state[0])}
+
+
+def _changed_features(before, after, timestamp):
+    """feature_changes rows turning the before values into the after values"""
+    rows = [(feature, timestamp) + value for feature, value in after.items() if before.get(feature) != value]
+    rows.extend((feature, timestamp, 0, 0) for feature in before
+                if feature not in after and before[feature] != (0, 0))
+    return rows
+
+
+def _merge_feature_changes(conn, put, drop=()):
+    """Add (feature, timestamp, total, in_use) change points, replacing any at the same second
+
+    drop removes points that match exactly. Each touched feature and day is
+    read, merged and written back once.
+    """
+    groups = {}
+    for remove, points in ((False, put), (True, drop)):
+        for feature, timestamp, total, in_use in points:
+            moment = datetime.fromisoformat(timestamp)
+            day = (moment - EPOCH).days
+            second = moment.hour * 3600 + moment.minute * 60 + moment.second
+            groups.setdefault((feature, day), []).append((remove, second, total, in_use))
+
+    for (feature, day), edits in groups.items():
+        row = conn.execute('SELECT data FROM feature_changes WHERE feature = ? AND day = ?',
+                           (feature, day)).fetchone()
+        packed = array('i')
+        if row is not None:
+            packed.frombytes(row['data'])
+        # Edits are spliced in place: a capture usually touches the end of a
+        # day, and decoding a whole day per capture made ingest quadratic
+        seconds = packed[0::3]
+        for remove, second, total, in_use in edits:
+            i = bisect_left(seconds, second)
+            found = i < len(seconds) and seconds[i] == second
+            if not remove:
+                if found:
+                    packed[3 * i + 1:3 * i + 3] = array('i', (total, in_use))
+                else:
+                    seconds.insert(i, second)
+                    packed[3 * i:3 * i] = array('i', (second, total, in_use))
+            elif found and packed[3 * i + 1] == total and packed[3 * i + 2] == in_use:
+                del seconds[i]
+                del packed[3 * i:3 * i + 3]
+
+        if not packed:
+            conn.execute('DELETE FROM feature_changes WHERE feature = ? AND day = ?', (feature, day))
+            continue
+        conn.execute('INSERT OR REPLACE INTO feature_changes (feature, day, data) VALUES (?, ?, ?)',
+                     (feature, day, packed.tobytes()))
+
+
+def _window_clause(start, end=None):
+    where, params = [], ()
+    if start is not None:
+        where.append('s.timestamp >= ?')
+        params += (start.isoformat(),)
+    if end is not None:
+        where.append('s.timestamp < ?')
+        params += (end.isoformat(),)
+    if not where:
+        return '', ()
+    return 'WHERE ' + ' AND '.join(where), params
+
+
+def _encode_frame(frame):
+    return zlib.compress(json.dumps(frame, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def _decode_frame(data):
+    return json.loads(zlib.decompress(data))
+
+
+def _user_from_row(row):
+    return {
+        'user': row['user'],
+        'host': row['host'],
+        'connection': row['connection'],
+        'start_time': row['start_time'],
+        'linger': row['linger'],
+        'details': row['details']
+    }
@@ -0,0 +1,59 @@
+"""Resuming an interrupted backfill (run from backend/: python -m pytest tests)"""
+import json
+import os
+import sys
+from datetime import datetime
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND)
+
+from backfill import backfill
+from store import SnapshotStore
+
+CAPTURE = open(os.path.join(BACKEND, '..', '234.txt'), encoding='utf-8').read()
+CAPTURE_NAMES = [f'20250101_00{minute:02d}00.txt' for minute in range(5)]
+
+
+def write_logs(logs_dir, names):
+    os.makedirs(logs_dir, exist_ok=True)
+    for name in names:
+        path = os.path.join(logs_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(CAPTURE)
+        if name == 'notes.txt':
+            # Timed before every capture, so it is the first chunk of a run
+            moment = datetime(2024, 12, 31).timestamp()
+            os.utime(path, (moment, moment))
+
+
+def run(logs_dir, store_path, reindex=False):
+    return backfill(logs_dir, os.path.join(logs_dir, 'archive'), store_path, workers=1, chunk_size=1,
+                    reindex=reindex)
+
+
+def test_resume_after_a_chunk_ending_on_a_non_capture_name(tmp_path):
+    store_path = str(tmp_path / 'licstats.db')
+    # The interrupted run got as far as notes.txt; a checkpoint of that era named it
+    write_logs(str(tmp_path / 'first'), ['notes.txt'])
+    run(str(tmp_path / 'first'), store_path)
+    with open(store_path + '.backfill.json', 'w', encoding='utf-8') as f:
+        json.dump({'reindex': False, 'last_filename': 'notes.txt'}, f)
+
+    logs_dir = str(tmp_path / 'logs')
+    write_logs(logs_dir, ['notes.txt'] + CAPTURE_NAMES)
+    assert run(logs_dir, store_path) == len(CAPTURE_NAMES)
+    assert SnapshotStore(store_path).known_filenames() == set(CAPTURE_NAMES) | {'notes.txt'}
+    assert not os.path.exists(store_path + '.backfill.json')
+
+
+def test_interrupted_reindex_is_not_cleared_again(tmp_path):
+    store_path = str(tmp_path / 'licstats.db')
+    logs_dir = str(tmp_path / 'logs')
+    write_logs(logs_dir, CAPTURE_NAMES)
+    assert run(logs_dir, store_path, reindex=True) == len(CAPTURE_NAMES)
+
+    # Left behind by a reindex that stopped after committing every chunk
+    with open(store_path + '.backfill.json', 'w', encoding='utf-8') as f:
+        json.dump({'reindex': True}, f)
+    assert run(logs_dir, store_path, reindex=True) == 0
+    assert SnapshotStore(store_path).known_filenames() == set(CAPTURE_NAMES)
@@ -0,0 +1,82 @@
+"""Stand-in for lmstat.exe that prints 234.txt-style output
+
+Used to exercise the collector without a license server, e.g. with
+    LMSTAT_COMMAND = "python tools/fake_lmstat.py -c {server} -a --delay 2"
+
+Usage (from backend/):
+    python tools/fake_lmstat.py -c 29000@srv1 -a
+    python tools/fake_lmstat.py -c 29000@srv1 --delay 1-5 --fail-rate 0.2
+    python tools/fake_lmstat.py -c 29000@srv2 --feature-prefix srv2_ --churn 0.3
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+TEMPLATE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '234.txt'))
+
+SERVER_RE = re.compile(r'^License server status: .*$', re.MULTILINE)
+FEATURE_HEADER_RE = re.compile(r'^(Users of )([^:]+)(:)', re.MULTILINE)
+USER_LINE_RE = re.compile(r'^\s+\S+ \S+ .*\(linger: \d+\)\n', re.MULTILINE)
+IN_USE_RE = re.compile(r'Total of (\d+) licenses? in use\)')
+
+
+def parse_delay(value):
+    """'2' -> (2, 2); '1-5' -> (1, 5)"""
+    low, _, high = value.partition('-')
+    return float(low), float(high or low)
+
+
+def drop_users(content, rng, churn):
+    """Drop a fraction of user lines and fix up the in-use counts of their features"""
+    blocks = FEATURE_HEADER_RE.split(content)
+    out = [blocks[0]]
+    # split() yields [preamble, 'Users of ', name, ':', body, 'Users of ', name, ':', body, ...]
+    for i in range(1, len(blocks), 4):
+        prefix, name, colon, body = blocks[i:i + 4]
+        kept = [m.group() for m in USER_LINE_RE.finditer(body) if rng.random() >= churn]
+        removed = len(USER_LINE_RE.findall(body)) - len(kept)
+        if removed:
+            body = USER_LINE_RE.sub('', body)
+            in_use = int(IN_USE_RE.search(body).group(1)) - removed
+            plural = 'license' if in_use == 1 else 'licenses'
+            body = IN_USE_RE.sub(f'Total of {in_use} {plural} in use)', body, count=1)
+            if kept:
+                body = body.rstrip('\n') + '\n\n' + ''.join(kept) + '\n'
+        out.append(prefix + name + colon + body)
+    return ''.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', dest='server', default='29000@HQCNDB', help='license server (port@host)')
+    parser.add_argument('-a', action='store_true', help='accepted for compatibility with lmstat')
+    parser.add_argument('--template', default=TEMPLATE_FILE)
+    parser.add_argument('--delay', type=parse_delay, default=(0, 0), help='seconds, or a min-max range')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='probability of exiting with an error')
+    parser.add_argument('--feature-prefix', default='', help='prefix every feature name, to tell servers apart')
+    parser.add_argument('--churn', type=float, default=0.0, help='fraction of user lines to drop at random')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    time.sleep(rng.uniform(*args.delay))
+    if rng.random() < args.fail_rate:
+        print(f"lmgrd is not running: Cannot connect to license server system. ({args.server})", file=sys.stderr)
+        sys.exit(1)
+
+    with open(args.template, 'r', encoding='utf-8') as f:
+        content = f.read()
+    content = SERVER_RE.sub(f'License server status: {args.server}', content, count=1)
+    if args.feature_prefix:
+        content = FEATURE_HEADER_RE.sub(lambda m: m.group(1) + args.feature_prefix + m.group(2) + m.group(3),
+                                        content)
+    if args.churn:
+        content = drop_users(content, rng, args.churn)
+    sys.stdout.write(content)
+
+
+if __name__ == '__main__':
+    main()
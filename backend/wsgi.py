@@ -0,0 +1,13 @@
+"""WSGI entry point of the API for external servers, e.g. (from backend/)
+
+    LICSTATS_MAX_SSE_CLIENTS=8 gunicorn -w 4 -k gthread --threads 16 --timeout 0 -b 0.0.0.0:5000 wsgi:app
+
+Serves the 'web' role: exactly one collector must run alongside it
+(python serve.py collector). Each /api/events stream holds one of the
+--threads, so leave more threads than LICSTATS_MAX_SSE_CLIENTS streams.
+"""
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('LICSTATS_ROLE', 'web'))